@@ -5,18 +5,25 @@ anomaly_detector.py - 异动检测后台任务
 每分钟从数据库读取K线数据，计算异动并更新异动汇总表
 """
 
+import os
 import time
 import threading
-import schedule
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from typing import List, Dict, Optional
-from datetime import datetime
 
-from database import db
+from database import db, AnomalyRow
 from log_config import setup_logging
+from network_config import TICKER_24HR_ALL_WEIGHT, binance_get
+import json_utils
+
+try:
+    from config import NETWORK_CONFIG
+except ImportError:
+    NETWORK_CONFIG = {"anomaly_check_interval": 60}
 
 # 初始化日志（幂等）
 setup_logging()
@@ -44,6 +51,15 @@ class AnomalyDetector:
         }
         
         self.running = False
+        self.check_interval = float(NETWORK_CONFIG.get("anomaly_check_interval", 60))
+        self._stop_event = threading.Event()  # stop() 时立即唤醒等待中的检测循环
+        
+        # 增量检测：symbol -> (最新K线签名, 上次写入时间)；最新K线未变化的合约跳过分析
+        # 签名包含最新K线的数值而非仅 open_time，因为未闭合K线会被收集器原地更新
+        self._last_seen: Dict[str, tuple] = {}
+        self.refresh_interval = 300  # 即使K线未变，也每5分钟重新写入一次，刷新 created_at
+        self.max_workers = os.cpu_count() or 1  # 批量分析的并行线程数
+        self._sorted_hist_cache: Dict[str, tuple] = {}  # symbol -> ((最新开盘时间, 长度), 排序后的历史绝对收益率)
         
         # 配置HTTP会话和重试策略
         self.session = requests.Session()
@@ -71,179 +87,285 @@ class AnomalyDetector:
         self.session.headers.update({
             'User-Agent': 'python-requests/2.31.0',
             'Connection': 'keep-alive',
-            'Accept': 'application/json'
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate'
         })
     
     def get_24h_volumes(self) -> Dict[str, float]:
         """获取24小时成交额数据（用于排序）"""
         try:
             url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
-            r = self.session.get(url, timeout=15)
+            r = binance_get(self.session, url, TICKER_24HR_ALL_WEIGHT, timeout=15)
             r.raise_for_status()
             
-            volumes = {}
-            for ticker in r.json():
-                volumes[ticker["symbol"]] = float(ticker.get("quoteVolume", 0) or 0)
-            return volumes
+            # 直接解析原始字节（gzip 已由 requests 透明解压）
+            return {t["symbol"]: float(t.get("quoteVolume") or 0) for t in json_utils.loads(r.content)}
         except Exception:
             logger.exception("获取24h成交额失败")
             return {}
     
-    def analyze_symbol_anomaly(self, symbol: str, klines: List[Dict], quote_volume_24h: float = 0) -> Optional[Dict]:
-        """分析单个合约的异动情况"""
+    def analyze_symbol_anomaly(self, symbol: str, klines: List[Dict], quote_volume_24h: float = 0) -> Optional[AnomalyRow]:
+        """分析单个合约的异动情况（按单合约批次走 analyze_all）"""
         if len(klines) < self.config["MIN_KLINES_REQUIRED"]:
             return None
         
         try:
-            # 提取数据
-            closes = np.array([k["close_price"] for k in klines])
-            volumes = np.array([k["quote_volume"] for k in klines])
-            highs = np.array([k["high_price"] for k in klines])
-            lows = np.array([k["low_price"] for k in klines])
-            
-            # 1. 价格收益率分析
-            returns = np.diff(closes) / closes[:-1]
-            if len(returns) < 5:
-                return None
-            
-            hist_returns = returns[:-1]
-            cur_ret = returns[-1]
-            cur_abs_ret = abs(cur_ret)
-            
-            # 检查最小收益率要求
-            if cur_abs_ret < self.config["MIN_ABS_RETURN"]:
-                return None
-            
-            # 价格异动指标
-            price_mean = float(np.mean(np.abs(hist_returns)))
-            price_std = float(np.std(np.abs(hist_returns), ddof=0))
-            price_zscore = float((cur_abs_ret - price_mean) / price_std) if price_std > 0 else 0
-            price_percentile = float((np.abs(hist_returns) < cur_abs_ret).sum()) / len(hist_returns) * 100
-            
-            # 2. 成交量异动分析
-            hist_volumes = volumes[:-1]
-            cur_volume = volumes[-1]
-            
-            volume_mean = float(np.mean(hist_volumes))
-            volume_std = float(np.std(hist_volumes, ddof=0))
-            volume_zscore = float((cur_volume - volume_mean) / volume_std) if volume_std > 0 else 0
-            
-            # 3. 波动率异动分析
-            true_ranges = (highs - lows) / closes * 100
-            hist_volatility = true_ranges[:-1]
-            cur_volatility = true_ranges[-1]
-            
-            vol_mean = float(np.mean(hist_volatility))
-            vol_std = float(np.std(hist_volatility, ddof=0))
-            volatility_zscore = float((cur_volatility - vol_mean) / vol_std) if vol_std > 0 else 0
-            
-            # 4. 综合异动评分
-            price_score = max(price_zscore - self.config["PRICE_Z_THRESHOLD"], 0) + \
-                         max(price_percentile - self.config["PRICE_PERCENTILE"], 0) / 10
-            volume_score = max(abs(volume_zscore) - self.config["VOLUME_Z_THRESHOLD"], 0)
-            volatility_score = max(volatility_zscore - self.config["VOLATILITY_Z_THRESHOLD"], 0)
-            
-            anomaly_score = (self.config["WEIGHT_PRICE"] * price_score + 
-                           self.config["WEIGHT_VOLUME"] * volume_score + 
-                           self.config["WEIGHT_VOLATILITY"] * volatility_score)
-            
-            # 5. 判断异动类型
-            reasons = []
-            is_anomaly = False
-            
-            if (price_zscore >= self.config["PRICE_Z_THRESHOLD"] or 
-                price_percentile >= self.config["PRICE_PERCENTILE"]):
-                reasons.append("价格")
-                is_anomaly = True
-            
-            if abs(volume_zscore) >= self.config["VOLUME_Z_THRESHOLD"]:
-                reasons.append("成交量")
-                is_anomaly = True
-            
-            if volatility_zscore >= self.config["VOLATILITY_Z_THRESHOLD"]:
-                reasons.append("波动率")
-                is_anomaly = True
-            
-            if anomaly_score >= self.config["ANOMALY_SCORE_THRESHOLD"]:
-                if not reasons:
-                    reasons.append("综合")
-                is_anomaly = True
-            
-            # 即使不是异动也记录（方便API查询全部数据）
-            if not reasons:
-                reasons = ["正常"]
-            
-            # 获取最新K线的时间戳
-            latest_kline = klines[-1]
-            
-            return {
-                "symbol": symbol,
-                "timestamp": latest_kline["open_time"] // 1000,  # 转换为秒
-                "interval_type": "15m",
-                "cur_return": cur_ret,
-                "cur_abs_return": cur_abs_ret,
-                "close_price": closes[-1],
-                "cur_volume": cur_volume,
-                "cur_volatility": cur_volatility,
-                "price_zscore": price_zscore,
-                "price_percentile": price_percentile,
-                "volume_zscore": volume_zscore,
-                "volatility_zscore": volatility_zscore,
-                "anomaly_score": anomaly_score,
-                "price_score": price_score,
-                "volume_score": volume_score,
-                "volatility_score": volatility_score,
-                "anomaly_reasons": "+".join(reasons),
-                "quote_volume_24h": quote_volume_24h,
-                "is_anomaly": is_anomaly
-            }
-            
+            open_times = np.array([klines[-1]["open_time"]], dtype=np.int64)
+            results = self.analyze_all([symbol], self._to_kline_matrix(klines)[np.newaxis], open_times,
+                                       {symbol: quote_volume_24h})
+            return results[0] if results else None
         except Exception:
             logger.exception(f"分析 {symbol} 异动时出错")
             return None
     
+    @staticmethod
+    def _to_kline_matrix(klines: List[Dict]) -> np.ndarray:
+        """把K线列表转换为 (n, 4) 的 float64 矩阵，列依次为 close/high/low/quote_volume"""
+        return np.array([(k["close_price"], k["high_price"], k["low_price"], k["quote_volume"])
+                         for k in klines], dtype=np.float64)
+    
+    def analyze_all(self, symbols: List[str], kline_matrix: np.ndarray, open_times: np.ndarray,
+                    volumes_24h: Optional[Dict[str, float]] = None,
+                    latest: Optional[np.ndarray] = None) -> List[AnomalyRow]:
+        """批量分析多个合约的异动情况
+        
+        kline_matrix 形状为 (N, n, 4)，N 个合约的K线数量必须相同，最后一维依次为
+        close/high/low/quote_volume；open_times 为各合约最新K线的开盘时间（毫秒）。
+        所有统计量沿 axis=1 一次性计算，避免逐个合约调用 NumPy 的开销。
+        矩阵通常为 float32，只用于历史统计（收益率在 float64 下计算，均值/方差累加使用 float64）；
+        latest 为 (N, 2, 4) 的最后两根K线 float64 值，当前收益率、收盘价、成交额和波动率都由它计算。
+        未提供时取 kline_matrix 的最后两行（矩阵本身为 float64 时没有精度损失）。
+        """
+        volumes_24h = volumes_24h or {}
+        closes = kline_matrix[:, :, 0]
+        highs = kline_matrix[:, :, 1]
+        lows = kline_matrix[:, :, 2]
+        volumes = kline_matrix[:, :, 3]
+        if latest is None:
+            latest = kline_matrix[:, -2:]
+        latest = latest.astype(np.float64, copy=False)
+        prev_close = latest[:, 0, 0]
+        last = latest[:, 1]
+        
+        # 1. 价格收益率分析（float32 收盘价相减会放大舍入误差，先转 float64）
+        hist_closes = closes[:, :-1].astype(np.float64)
+        hist_returns = np.diff(hist_closes, axis=1) / hist_closes[:, :-1]
+        if hist_returns.shape[1] < 4:
+            return []
+        
+        cur_ret = (last[:, 0] - prev_close) / prev_close
+        cur_abs_ret = np.abs(cur_ret)
+        
+        # 检查最小收益率要求
+        is_valid = cur_abs_ret >= self.config["MIN_ABS_RETURN"]
+        if not is_valid.any():
+            return []
+        
+        # 价格异动指标
+        abs_hist = np.abs(hist_returns)
+        price_zscore = self._zscore(cur_abs_ret, *self._mean_std(abs_hist))
+        
+        # 2. 成交量异动分析
+        hist_volumes = volumes[:, :-1]
+        cur_volume = last[:, 3]
+        volume_zscore = self._zscore(cur_volume, *self._mean_std(hist_volumes))
+        
+        # 3. 波动率异动分析
+        hist_volatility = (highs[:, :-1] - lows[:, :-1]) / closes[:, :-1] * 100
+        cur_volatility = (last[:, 1] - last[:, 2]) / last[:, 0] * 100
+        volatility_zscore = self._zscore(cur_volatility, *self._mean_std(hist_volatility))
+        
+        results = []
+        for i in np.flatnonzero(is_valid):
+            symbol = symbols[i]
+            # 价格百分位：在已排序的历史绝对收益率中二分查找，O(log n)
+            sorted_hist = self._sorted_abs_hist(symbol, int(open_times[i]), abs_hist[i])
+            price_percentile = np.searchsorted(sorted_hist, cur_abs_ret[i], side='left') / len(sorted_hist) * 100
+            results.append(self._build_result(
+                symbol,
+                int(open_times[i]) // 1000,  # 转换为秒
+                float(cur_ret[i]),
+                float(last[i, 0]),
+                float(cur_volume[i]),
+                float(cur_volatility[i]),
+                float(price_zscore[i]),
+                float(price_percentile),
+                float(volume_zscore[i]),
+                float(volatility_zscore[i]),
+                volumes_24h.get(symbol, 0),
+            ))
+        return results
+    
+    def _sorted_abs_hist(self, symbol: str, latest_open_time: int, abs_hist: np.ndarray) -> np.ndarray:
+        """返回排序后的历史绝对收益率（按合约缓存）
+
+        历史收益率只由已闭合K线决定，最新K线开盘时间和窗口长度不变时不会变化，
+        因此同一根K线内的多次检测只需排序一次。
+        """
+        key = (latest_open_time, len(abs_hist))
+        cached = self._sorted_hist_cache.get(symbol)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        sorted_hist = np.sort(abs_hist)
+        self._sorted_hist_cache[symbol] = (key, sorted_hist)
+        return sorted_hist
+    
+    @staticmethod
+    def _mean_std(a: np.ndarray):
+        """逐行均值与总体标准差（sum/sumsq 一次遍历，不分配中间数组）
+
+        方差相对均值平方小于 1e-12 时视为0，避免常数序列因舍入误差得到
+        极小的非零标准差而放大z-score。
+        """
+        n = a.shape[1]
+        mean = a.sum(axis=1, dtype=np.float64) / n
+        var = np.einsum('ij,ij->i', a, a, dtype=np.float64) / n - mean * mean
+        var[var <= 1e-12 * mean * mean] = 0.0
+        return mean, np.sqrt(var)
+    
+    @staticmethod
+    def _zscore(cur: np.ndarray, mean: np.ndarray, std: np.ndarray) -> np.ndarray:
+        """逐行计算z-score，标准差为0时结果为0"""
+        has_std = std > 0
+        return np.where(has_std, (cur - mean) / np.where(has_std, std, 1), 0.0)
+    
+    def _build_result(self, symbol: str, timestamp: int, cur_ret: float, close_price: float,
+                      cur_volume: float, cur_volatility: float, price_zscore: float,
+                      price_percentile: float, volume_zscore: float, volatility_zscore: float,
+                      quote_volume_24h: float) -> AnomalyRow:
+        """根据各项异动指标计算综合评分并组装结果"""
+        # 4. 综合异动评分
+        price_score = max(price_zscore - self.config["PRICE_Z_THRESHOLD"], 0) + \
+                     max(price_percentile - self.config["PRICE_PERCENTILE"], 0) / 10
+        volume_score = max(abs(volume_zscore) - self.config["VOLUME_Z_THRESHOLD"], 0)
+        volatility_score = max(volatility_zscore - self.config["VOLATILITY_Z_THRESHOLD"], 0)
+        
+        anomaly_score = (self.config["WEIGHT_PRICE"] * price_score + 
+                       self.config["WEIGHT_VOLUME"] * volume_score + 
+                       self.config["WEIGHT_VOLATILITY"] * volatility_score)
+        
+        # 5. 判断异动类型
+        reasons = []
+        is_anomaly = False
+        
+        if (price_zscore >= self.config["PRICE_Z_THRESHOLD"] or 
+            price_percentile >= self.config["PRICE_PERCENTILE"]):
+            reasons.append("价格")
+            is_anomaly = True
+        
+        if abs(volume_zscore) >= self.config["VOLUME_Z_THRESHOLD"]:
+            reasons.append("成交量")
+            is_anomaly = True
+        
+        if volatility_zscore >= self.config["VOLATILITY_Z_THRESHOLD"]:
+            reasons.append("波动率")
+            is_anomaly = True
+        
+        if anomaly_score >= self.config["ANOMALY_SCORE_THRESHOLD"]:
+            if not reasons:
+                reasons.append("综合")
+            is_anomaly = True
+        
+        # 即使不是异动也记录（方便API查询全部数据）
+        if not reasons:
+            reasons = ["正常"]
+        
+        return AnomalyRow(symbol, timestamp, "15m", cur_ret, abs(cur_ret), close_price,
+                          cur_volume, cur_volatility, price_zscore, price_percentile,
+                          volume_zscore, volatility_zscore, anomaly_score, price_score,
+                          volume_score, volatility_score, "+".join(reasons),
+                          quote_volume_24h, is_anomaly)
+    
+    def _analyze_chunk(self, task) -> Optional[List[AnomalyRow]]:
+        """线程池任务：批量分析一组K线数量相同的合约，出错时返回 None"""
+        symbols, matrices, open_times, latests, volumes_24h = task
+        try:
+            return self.analyze_all(symbols, np.stack(matrices),
+                                    np.array(open_times, dtype=np.int64), volumes_24h, np.stack(latests))
+        except Exception:
+            logger.exception(f"批量分析 {len(symbols)} 个合约时出错")
+            return None
+    
     def detect_anomalies(self):
         """检测所有合约的异动"""
-        logger.info(f"[{datetime.now().strftime('%H:%M:%S')}] 开始异动检测...")
+        logger.info("开始异动检测...")
 
         try:
             # 获取24h成交额数据
             volumes_24h = self.get_24h_volumes()
             
-            # 获取数据库中所有有数据的合约
-            conn = db.get_connection()
-            cursor = conn.execute("SELECT DISTINCT symbol FROM klines")
-            symbols = [row[0] for row in cursor.fetchall()]
-            conn.close()
+            # 一次查询获取所有合约最近的K线数据
+            all_klines = db.get_all_recent_klines(limit_per_symbol=150)
+            
+            # 按K线数量分组，同组合约堆叠成一个矩阵批量计算
+            now = time.monotonic()
+            groups: Dict[int, tuple] = {}
+            signatures: Dict[str, tuple] = {}
+            skipped = 0
+            for symbol, (kline_open_times, kline_matrix, latest) in all_klines.items():
+                if len(kline_matrix) < self.config["MIN_KLINES_REQUIRED"]:
+                    continue
+                
+                # 最新K线与上次分析时完全相同且未到刷新时间，结果不会变化，直接跳过
+                signature = (int(kline_open_times[-1]), len(kline_matrix), *latest[-1].tolist())
+                seen = self._last_seen.get(symbol)
+                if seen is not None and seen[0] == signature and now - seen[1] < self.refresh_interval:
+                    skipped += 1
+                    continue
+                signatures[symbol] = signature
+                
+                group_symbols, matrices, open_times, latests = groups.setdefault(len(kline_matrix), ([], [], [], []))
+                group_symbols.append(symbol)
+                matrices.append(kline_matrix)
+                open_times.append(kline_open_times[-1])
+                latests.append(latest)
+            
+            # 每组再切成若干块交给线程池并行计算（NumPy 大数组运算会释放GIL），
+            # 所有K线已预先取出，工作线程不访问数据库
+            tasks = []
+            for group_symbols, matrices, open_times, latests in groups.values():
+                step = -(-len(group_symbols) // self.max_workers)
+                for i in range(0, len(group_symbols), step):
+                    tasks.append((group_symbols[i:i + step], matrices[i:i + step],
+                                  open_times[i:i + step], latests[i:i + step], volumes_24h))
+            
+            all_results: List[AnomalyRow] = []
+            if len(tasks) > 1:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as ex:
+                    task_results = list(ex.map(self._analyze_chunk, tasks))
+            else:
+                task_results = [self._analyze_chunk(task) for task in tasks]
             
-            anomaly_count = 0
-            total_processed = 0
+            for (chunk_symbols, *_), results in zip(tasks, task_results):
+                if results is None:
+                    continue
+                # 未产生结果的合约（收益率不足）同样记为已分析
+                for symbol in chunk_symbols:
+                    self._last_seen[symbol] = (signatures[symbol], now)
+                all_results.extend(results)
             
-            for symbol in symbols:
-                try:
-                    # 获取最近的K线数据
-                    klines = db.get_recent_klines(symbol, limit=150)
-                    
-                    if len(klines) < self.config["MIN_KLINES_REQUIRED"]:
-                        continue
-                    
-                    # 分析异动
-                    volume_24h = volumes_24h.get(symbol, 0)
-                    result = self.analyze_symbol_anomaly(symbol, klines, volume_24h)
-                    
-                    if result:
-                        # 存储结果到数据库
+            # 存储结果到数据库：整轮结果一次事务写入，失败时逐条重试
+            try:
+                db.insert_anomalies_many(all_results)
+                stored = all_results
+            except Exception:
+                logger.exception(f"批量写入 {len(all_results)} 条异动结果失败，改为逐条写入")
+                stored = []
+                for result in all_results:
+                    try:
                         db.insert_anomaly(result)
-                        total_processed += 1
-                        
-                        if result["is_anomaly"]:
-                            anomaly_count += 1
-                            logger.info(f"  异动: {symbol} ({result['anomaly_reasons']}) 评分={result['anomaly_score']:.2f}")
-                
-                except Exception:
-                    logger.exception(f"处理 {symbol} 时出错")
+                        stored.append(result)
+                    except Exception:
+                        # 写入失败，下一轮重新分析
+                        self._last_seen.pop(result.symbol, None)
+                        logger.exception(f"处理 {result.symbol} 时出错")
             
-            logger.info(f"[{datetime.now().strftime('%H:%M:%S')}] 异动检测完成: {total_processed}个合约, {anomaly_count}个异动")
+            # 每轮只输出一条汇总日志，避免异动集中爆发时逐条日志拖慢检测
+            anomalies = [r for r in stored if r.is_anomaly]
+            summary = ", ".join(f"{r.symbol}({r.anomaly_reasons}) {r.anomaly_score:.2f}"
+                                for r in anomalies)
+            logger.info("异动检测完成: %d个合约, %d个异动, %d个合约K线未变化已跳过%s",
+                        len(stored), len(anomalies), skipped, f" | {summary}" if summary else "")
             
         except Exception:
             logger.exception("异动检测出错")
@@ -253,23 +375,26 @@ class AnomalyDetector:
         if self.running:
             return
         self.running = True
+        self._stop_event.clear()
         logger.info("异动检测器已启动")
 
-        # 立即执行一次
-        self.detect_anomalies()
-
-        # 安排定时任务 - 每分钟执行一次
-        schedule.every().minute.do(self.detect_anomalies)
-
-        # 运行调度器
+        # 立即执行一次，之后按固定周期执行（以单调时钟为基准，不受检测耗时影响）
+        next_t = time.monotonic()
         while self.running:
-            schedule.run_pending()
-            time.sleep(1)
+            self.detect_anomalies()
+            next_t += self.check_interval
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                if self._stop_event.wait(delay):
+                    break
+            else:
+                # 检测耗时超过一个周期，从当前时刻重新计时，避免连续追赶
+                next_t = time.monotonic()
     
     def stop(self):
         """停止异动检测任务"""
         self.running = False
-        schedule.clear()
+        self._stop_event.set()
         # 关闭session连接
         if hasattr(self, 'session'):
             self.session.close()
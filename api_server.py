@@ -6,14 +6,32 @@ api_server.py - API服务器
 """
 
 from flask import Flask, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+import functools
 import time
 from datetime import datetime
 from typing import Dict, List
+import numpy as np
 
 from database import db
+import json_utils
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """基于 orjson 的 JSON provider，加快 jsonify 大列表响应的序列化"""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return json_utils.dumps(obj, default=self.default, sort_keys=self.sort_keys,
+                                indent=kwargs.get("indent") is not None)
+
+    def loads(self, s, **kwargs):
+        return json_utils.loads(s)
+
 
 app = Flask(__name__)
+if json_utils.orjson is not None:
+    app.json = OrjsonProvider(app)
 CORS(app)  # 允许跨域请求
 try:
     # 设置日志（幂等）
@@ -25,6 +43,23 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+_TIME_FMT = '%Y-%m-%d %H:%M:%S'
+_ts_format_cache = (None, '')  # (秒级时间戳, 格式化结果)，整体替换保证多线程下一致
+
+
+def _format_ts(ts: int) -> str:
+    """秒/毫秒时间戳 -> 'YYYY-MM-DD HH:MM:SS'（同一秒的结果直接复用）"""
+    global _ts_format_cache
+    if ts > 1_000_000_000_000:  # 毫秒
+        ts //= 1000
+    cached_ts, cached_str = _ts_format_cache
+    if cached_ts == ts:
+        return cached_str
+    formatted = datetime.fromtimestamp(ts).strftime(_TIME_FMT)
+    _ts_format_cache = (ts, formatted)
+    return formatted
+
+
 def format_update_time(val) -> str:
     """把数据库或时间戳的 last_update 解析为中文格式字符串 'YYYY-MM-DD HH:MM:SS'.
 
@@ -35,32 +70,19 @@ def format_update_time(val) -> str:
     否则返回原始字符串表示。
     """
     try:
-        # 直接处理数值（秒或毫秒）
+        # 数值（最常见）：直接格式化，不做任何解析
         if isinstance(val, (int, float)):
-            ts = int(val)
-            if ts > 1_000_000_000_000:  # 毫秒
-                ts = ts // 1000
-            return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+            return _format_ts(int(val))
 
-        # 字符串处理
         if isinstance(val, str):
             s = val.strip()
-            if s.isdigit():
-                ts = int(s)
-                if ts > 1_000_000_000_000:
-                    ts = ts // 1000
-                return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-            # 尝试解析 ISO 格式
+            if s.lstrip('-').isdigit():
+                return _format_ts(int(s))
+            # ISO 格式（fromisoformat 同时支持 'T' 与空格分隔）
             try:
-                dt = datetime.fromisoformat(s)
-                return dt.strftime('%Y-%m-%d %H:%M:%S')
-            except Exception:
-                # 回退：尝试常见带空格的时间格式
-                try:
-                    dt = datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
-                    return dt.strftime('%Y-%m-%d %H:%M:%S')
-                except Exception:
-                    return s
+                return datetime.fromisoformat(s).strftime(_TIME_FMT)
+            except ValueError:
+                return s
 
     except Exception:
         pass
@@ -68,18 +90,114 @@ def format_update_time(val) -> str:
     return str(val)
 
 
+_now_str_cache = (0, '')  # (当前秒, 格式化结果)
+
+
 def get_update_time() -> str:
-    """返回中文格式的当前时间，供接口顶层 `update` 字段使用。"""
-    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    """返回中文格式的当前时间，供接口顶层 `update` 字段使用。
+
+    每秒只格式化一次，同一秒内的请求复用同一个字符串。
+    """
+    global _now_str_cache
+    now = int(time.time())
+    cached_sec, cached_str = _now_str_cache
+    if cached_sec == now:
+        return cached_str
+    formatted = time.strftime(_TIME_FMT, time.localtime(now))
+    _now_str_cache = (now, formatted)
+    return formatted
+
+# aster 交易对缓存（启动时更新一次，变化很少，按TTL复用）
+ASTER_CACHE_TTL = 60
+_aster_cache = {"ts": 0.0, "set": frozenset()}
+
+def get_aster_symbols() -> frozenset:
+    """获取aster交易所支持的交易对集合（带60秒缓存）
 
-def get_aster_symbols() -> set:
-    """获取aster交易所支持的交易对集合"""
+    返回 frozenset，可在多个请求线程间安全共享。
+    """
+    now = time.monotonic()
+    if _aster_cache["ts"] and now - _aster_cache["ts"] < ASTER_CACHE_TTL:
+        return _aster_cache["set"]
     try:
-        aster_symbols = db.get_aster_symbols()
-        return {symbol['symbol'] for symbol in aster_symbols}
+        aster_symbols = frozenset(symbol['symbol'] for symbol in db.get_aster_symbols())
     except Exception as e:
         logger.error(f"获取aster交易对失败: {e}")
-        return set()
+        return _aster_cache["set"]
+    _aster_cache["set"] = aster_symbols
+    _aster_cache["ts"] = now
+    return aster_symbols
+
+def ttl_cache(ttl: float):
+    """极简TTL缓存装饰器（用于无参数函数），结果在 ttl 秒内直接复用
+
+    缓存为 (时间, 结果) 元组整体替换，多线程下无需加锁；过期时并发请求
+    可能各自重算一次，结果相同，可以接受。
+    """
+    def decorator(func):
+        cached = (0.0, None)
+
+        @functools.wraps(func)
+        def wrapper():
+            nonlocal cached
+            now = time.monotonic()
+            ts, val = cached
+            if ts and now - ts < ttl:
+                return val
+            val = func()
+            cached = (now, val)
+            return val
+        return wrapper
+    return decorator
+
+@ttl_cache(5)
+def cached_symbol_stats() -> Dict:
+    """数据库统计（5秒缓存，健康检查和统计接口共用）"""
+    return db.get_symbol_stats()
+
+@ttl_cache(5)
+def cached_data_size_info() -> Dict:
+    """数据库记录数与最早数据时间（5秒缓存）"""
+    return db.get_data_size_info()
+
+@ttl_cache(30)
+def cached_anomaly_count_1h() -> int:
+    """最近1小时的异动数量（30秒缓存）"""
+    recent_anomalies = db.get_recent_anomalies("15m", 1, 1000, columns=('anomaly_reasons',))
+    return sum(1 for a in recent_anomalies if a['anomaly_reasons'] != '正常')
+
+# 异动接口需要取整的列：(字段名, 缩放系数, 小数位)
+_ANOMALY_ROUND_COLUMNS = [
+    ('cur_return', 100, 3),
+    ('price_zscore', 1, 2),
+    ('price_percentile', 1, 1),
+    ('volume_zscore', 1, 2),
+    ('volatility_zscore', 1, 2),
+    ('anomaly_score', 1, 3),
+    ('price_score', 1, 3),
+    ('volume_score', 1, 3),
+    ('volatility_score', 1, 3),
+]
+_TOP_ANOMALY_ROUND_COLUMNS = [
+    ('cur_return', 100, 2),
+    ('anomaly_score', 1, 2),
+    ('price_zscore', 1, 2),
+    ('volume_zscore', 1, 2),
+    ('volatility_zscore', 1, 2),
+]
+
+# 异动排行接口实际用到的列（只从数据库读取这些列）
+_TOP_ANOMALY_COLUMNS = ('symbol', 'timestamp', 'anomaly_reasons', 'quote_volume_24h',
+                        *(name for name, _, _ in _TOP_ANOMALY_ROUND_COLUMNS))
+
+def round_columns(rows: List[Dict], columns: List[tuple]) -> List[List[float]]:
+    """把多行记录的数值列堆叠成矩阵后一次性缩放并取整，返回逐行的取整结果"""
+    if not rows:
+        return []
+    arr = np.array([[row[name] for name, _, _ in columns] for row in rows], dtype=np.float64)
+    scale = np.array([s for _, s, _ in columns], dtype=np.float64)
+    factor = 10.0 ** np.array([d for _, _, d in columns], dtype=np.float64)
+    return (np.rint(arr * scale * factor) / factor).tolist()
 
 def filter_symbols_by_exchange(symbols: List[str], exchange: str) -> List[str]:
     """根据交易所过滤交易对"""
@@ -94,10 +212,10 @@ def filter_symbols_by_exchange(symbols: List[str], exchange: str) -> List[str]:
 def health_check():
     """健康检查接口"""
     try:
-        stats = db.get_symbol_stats()
+        stats = cached_symbol_stats()
         
         # 获取数据库详细信息
-        size_info = db.get_data_size_info()
+        size_info = cached_data_size_info()
         
         return jsonify({
             "status": "healthy",
@@ -136,29 +254,26 @@ def get_anomalies():
         anomaly_only = request.args.get('anomaly_only', 'false').lower() == 'true'
         exchange = request.args.get('exchange', 'binance').lower()
         
+        # 交易所过滤下推到SQL（aster时仅查询其支持的交易对）
+        symbol_filter = get_aster_symbols() if exchange == 'aster' else None
+        
         # 从数据库获取数据
-        anomalies = db.get_recent_anomalies(interval_type, hours, limit * 2)  # 获取更多以便过滤
+        anomalies = db.get_recent_anomalies(interval_type, hours, limit * 2,
+                                            symbol_filter=symbol_filter)  # 获取更多以便分数过滤
+        
+        # 应用过滤器（分数过滤、仅异动过滤），并限制结果数量
+        selected = [
+            anomaly for anomaly in anomalies
+            if anomaly['anomaly_score'] >= min_score
+            and not (anomaly_only and anomaly['anomaly_reasons'] == '正常')
+        ][:limit]
         
-        # 如果是aster交易所，获取支持的交易对
-        aster_symbols = set()
-        if exchange == 'aster':
-            aster_symbols = get_aster_symbols()
+        # 数值列一次性批量取整
+        rounded = round_columns(selected, _ANOMALY_ROUND_COLUMNS)
         
-        # 应用过滤器
         filtered_anomalies = []
-        for anomaly in anomalies:
-            # 交易所过滤
-            if exchange == 'aster' and anomaly['symbol'] not in aster_symbols:
-                continue
-            
-            # 分数过滤
-            if anomaly['anomaly_score'] < min_score:
-                continue
-            
-            # 仅异动过滤
-            if anomaly_only and anomaly['anomaly_reasons'] == '正常':
-                continue
-                
+        for anomaly, (ret_pct, price_z, price_pct, volume_z, volatility_z,
+                      score, price_score, volume_score, volatility_score) in zip(selected, rounded):
             filtered_anomalies.append({
                 "symbol": anomaly['symbol'],
                 "timestamp": anomaly['timestamp'],
@@ -166,7 +281,7 @@ def get_anomalies():
                 "interval_type": anomaly['interval_type'],
                 
                 # 价格数据
-                "current_return_pct": round(anomaly['cur_return'] * 100, 3),
+                "current_return_pct": ret_pct,
                 "close_price": anomaly['close_price'],
                 
                 # 成交量数据
@@ -174,16 +289,16 @@ def get_anomalies():
                 "current_volatility": anomaly['cur_volatility'],
                 
                 # 异动指标
-                "price_zscore": round(anomaly['price_zscore'], 2),
-                "price_percentile": round(anomaly['price_percentile'], 1),
-                "volume_zscore": round(anomaly['volume_zscore'], 2),
-                "volatility_zscore": round(anomaly['volatility_zscore'], 2),
+                "price_zscore": price_z,
+                "price_percentile": price_pct,
+                "volume_zscore": volume_z,
+                "volatility_zscore": volatility_z,
                 
                 # 评分
-                "anomaly_score": round(anomaly['anomaly_score'], 3),
-                "price_score": round(anomaly['price_score'], 3),
-                "volume_score": round(anomaly['volume_score'], 3),
-                "volatility_score": round(anomaly['volatility_score'], 3),
+                "anomaly_score": score,
+                "price_score": price_score,
+                "volume_score": volume_score,
+                "volatility_score": volatility_score,
                 
                 # 异动类型和成交额
                 "anomaly_reasons": anomaly['anomaly_reasons'],
@@ -192,9 +307,6 @@ def get_anomalies():
                 "created_at": anomaly['created_at']
             })
         
-        # 限制结果数量
-        filtered_anomalies = filtered_anomalies[:limit]
-        
         return jsonify({
             "status": "success",
             "update": get_update_time(),
@@ -226,35 +338,30 @@ def get_top_anomalies():
         hours = int(request.args.get('hours', 24))
         exchange = request.args.get('exchange', 'binance').lower()
         
-        # 获取数据并按评分排序
-        anomalies = db.get_recent_anomalies("15m", hours, limit * 3)
+        # 获取数据并按评分排序（交易所过滤在SQL中完成）
+        symbol_filter = get_aster_symbols() if exchange == 'aster' else None
+        anomalies = db.get_recent_anomalies("15m", hours, limit * 3, symbol_filter=symbol_filter,
+                                            columns=_TOP_ANOMALY_COLUMNS)
         
-        # 如果是aster交易所，获取支持的交易对
-        aster_symbols = set()
-        if exchange == 'aster':
-            aster_symbols = get_aster_symbols()
-        
-        # 过滤掉正常数据，只返回异动，并应用交易所过滤
-        top_anomalies = []
-        for a in anomalies:
-            if a['anomaly_reasons'] == '正常' or a['anomaly_score'] <= 0.5:
-                continue
-            if exchange == 'aster' and a['symbol'] not in aster_symbols:
-                continue
-            top_anomalies.append(a)
+        # 过滤掉正常数据，只返回异动
+        top_anomalies = [
+            a for a in anomalies
+            if a['anomaly_reasons'] != '正常' and a['anomaly_score'] > 0.5
+        ]
         
         top_anomalies = top_anomalies[:limit]
+        rounded = round_columns(top_anomalies, _TOP_ANOMALY_ROUND_COLUMNS)
         
         result = []
-        for anomaly in top_anomalies:
+        for anomaly, (ret_pct, score, price_z, volume_z, volatility_z) in zip(top_anomalies, rounded):
             result.append({
                 "rank": len(result) + 1,
                 "symbol": anomaly['symbol'],
-                "current_return_pct": round(anomaly['cur_return'] * 100, 2),
-                "anomaly_score": round(anomaly['anomaly_score'], 2),
-                "price_zscore": round(anomaly['price_zscore'], 2),
-                "volume_zscore": round(anomaly['volume_zscore'], 2),
-                "volatility_zscore": round(anomaly['volatility_zscore'], 2),
+                "current_return_pct": ret_pct,
+                "anomaly_score": score,
+                "price_zscore": price_z,
+                "volume_zscore": volume_z,
+                "volatility_zscore": volatility_z,
                 "quote_volume_24h": int(anomaly['quote_volume_24h']),
                 "anomaly_reasons": anomaly['anomaly_reasons'],
                 "datetime": datetime.fromtimestamp(anomaly['timestamp']).strftime('%H:%M:%S')
@@ -282,20 +389,20 @@ def get_symbol_klines(symbol):
     try:
         limit = int(request.args.get('limit', 100))
         
-        klines = db.get_recent_klines(symbol, limit)
-        
-        result = []
-        for kline in klines:
-            result.append({
-                "timestamp": kline['open_time'],
-                "datetime": datetime.fromtimestamp(kline['open_time'] // 1000).isoformat(),
-                "open": kline['open_price'],
-                "high": kline['high_price'],
-                "low": kline['low_price'],
-                "close": kline['close_price'],
-                "volume": kline['volume'],
-                "quote_volume": kline['quote_volume']
-            })
+        klines = db.get_recent_klines_np(symbol, limit)
+        
+        # 按列一次性转成 Python 数值，再逐行组装
+        result = [{
+            "timestamp": open_time,
+            "datetime": datetime.fromtimestamp(open_time // 1000).isoformat(),
+            "open": open_price,
+            "high": high_price,
+            "low": low_price,
+            "close": close_price,
+            "volume": volume,
+            "quote_volume": quote_volume
+        } for open_time, open_price, high_price, low_price, close_price, volume, quote_volume in zip(
+            *(klines[name].tolist() for name in db.KLINE_NP_DTYPE.names))]
         
         return jsonify({
             "status": "success",
@@ -319,21 +426,13 @@ def get_coins():
         limit = int(request.args.get('limit',10))
         exchange = request.args.get('exchange', 'binance').lower()
         
-        # 从独立的ai_coins表获取数据
-        coins_data = db.get_ai_coins(limit * 2)  # 获取更多数据以便过滤
+        # 从独立的ai_coins表获取数据（交易所过滤在SQL中完成）
+        symbol_filter = get_aster_symbols() if exchange == 'aster' else None
+        coins_data = db.get_ai_coins(limit, symbol_filter=symbol_filter)
         
-        # 如果是aster交易所，获取支持的交易对
-        aster_symbols = set()
-        if exchange == 'aster':
-            aster_symbols = get_aster_symbols()
-        
-        # 转换格式并过滤交易所
+        # 转换格式
         coins = []
         for coin in coins_data:
-            # 交易所过滤
-            if exchange == 'aster' and coin['symbol'] not in aster_symbols:
-                continue
-                
             coin_result = {
                 "pair": coin['symbol'],
                 "score": round(coin['score'], 1),
@@ -345,10 +444,6 @@ def get_coins():
                 "increase_percent": round(coin['increase_percent'], 2)
             }
             coins.append(coin_result)
-            
-            # 限制数量
-            if len(coins) >= limit:
-                break
         
         return jsonify({
             "success": True,
@@ -376,21 +471,13 @@ def get_oi_top():
         limit = int(request.args.get('limit', 20))
         exchange = request.args.get('exchange', 'binance').lower()
         
-        # 从独立的oi_rankings表获取数据
-        oi_data = db.get_oi_rankings(limit * 2)  # 获取更多数据以便过滤
+        # 从独立的oi_rankings表获取数据（交易所过滤在SQL中完成）
+        symbol_filter = get_aster_symbols() if exchange == 'aster' else None
+        oi_data = db.get_oi_rankings(limit, symbol_filter=symbol_filter)
         
-        # 如果是aster交易所，获取支持的交易对
-        aster_symbols = set()
-        if exchange == 'aster':
-            aster_symbols = get_aster_symbols()
-        
-        # 转换格式并过滤交易所
+        # 转换格式
         positions = []
         for oi in oi_data:
-            # 交易所过滤
-            if exchange == 'aster' and oi['symbol'] not in aster_symbols:
-                continue
-                
             position = {
                 "symbol": oi['symbol'],
                 "rank": len(positions) + 1,  # 重新排序
@@ -403,10 +490,6 @@ def get_oi_top():
                 "net_short": round(oi['net_short'], 2)
             }
             positions.append(position)
-            
-            # 限制数量
-            if len(positions) >= limit:
-                break
         
         return jsonify({
             "success": True,
@@ -433,11 +516,10 @@ def get_oi_top():
 def get_stats():
     """获取统计信息"""
     try:
-        stats = db.get_symbol_stats()
+        stats = cached_symbol_stats()
         
         # 获取最近1小时的异动数量
-        recent_anomalies = db.get_recent_anomalies("15m", 1, 1000)
-        anomaly_count_1h = len([a for a in recent_anomalies if a['anomaly_reasons'] != '正常'])
+        anomaly_count_1h = cached_anomaly_count_1h()
         
         return jsonify({
             "status": "success",
@@ -521,9 +603,10 @@ def index():
     """
 
 if __name__ == '__main__':
-    logger.info("=== 币安异动检测 API 服务器 ===")
+    # 仅用于本地调试；生产环境请使用: gunicorn -k gevent -w 4 -b 0.0.0.0:5000 wsgi:application
+    logger.info("=== 币安异动检测 API 服务器（开发模式）===")
     logger.info("启动API服务器...")
     logger.info("访问 http://localhost:5000 查看API文档")
     logger.info("访问 http://localhost:5000/api/health 进行健康检查")
     
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
\ No newline at end of file
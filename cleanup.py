@@ -9,71 +9,81 @@ python cleanup.py --info       # 仅显示数据库信息，不清理
 """
 
 import argparse
+import logging
 import time
-from datetime import datetime, timedelta
-from database import Database
+from database import Database, db
+from log_config import setup_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+_SIZE_UNITS = ("B", "KB", "MB")
 
 def format_time(timestamp):
     """格式化时间戳为可读格式"""
     if timestamp:
-        return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
     return "无数据"
 
 def format_size(bytes_size):
-    """格式化文件大小"""
-    if bytes_size < 1024:
+    """格式化文件大小（按 1024 的幂直接计算单位下标，最大到 MB）"""
+    i = min((int(bytes_size).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1) if bytes_size >= 1024 else 0
+    if i == 0:
         return f"{bytes_size} B"
-    elif bytes_size < 1024 * 1024:
-        return f"{bytes_size/1024:.1f} KB"
-    else:
-        return f"{bytes_size/(1024*1024):.1f} MB"
+    return f"{bytes_size / (1 << (10 * i)):.1f} {_SIZE_UNITS[i]}"
 
 def show_database_info(db):
     """显示数据库详细信息"""
-    print("=== 数据库信息 ===")
+    logger.info("=== 数据库信息 ===")
     
     # 基础统计
     stats = db.get_symbol_stats()
-    print(f"文件大小: {stats['file_size_mb']} MB")
-    print(f"数据保留时间: {stats['max_age_hours']} 小时")
-    print(f"监控合约数量: {stats['symbol_count']}")
-    print(f"K线数据条数: {stats['kline_count']}")
-    print(f"24小时异动数: {stats['anomaly_count_24h']}")
+    logger.info(f"文件大小: {stats['file_size_mb']} MB")
+    logger.info(f"数据保留时间: {stats['max_age_hours']} 小时")
+    logger.info(f"监控合约数量: {stats['symbol_count']}")
+    logger.info(f"K线数据条数: {stats['kline_count']}")
+    logger.info(f"24小时异动数: {stats['anomaly_count_24h']}")
     
     # 详细信息
     size_info = db.get_data_size_info()
-    print(f"\n=== 各表记录数 ===")
-    print(f"K线数据: {size_info['records']['klines']}")
-    print(f"异动数据: {size_info['records']['anomalies']}")
-    print(f"AI选币: {size_info['records']['ai_coins']}")
-    print(f"持仓量排行: {size_info['records']['oi_rankings']}")
+    logger.info("=== 各表记录数 ===")
+    logger.info(f"K线数据: {size_info['records']['klines']}")
+    logger.info(f"异动数据: {size_info['records']['anomalies']}")
+    logger.info(f"AI选币: {size_info['records']['ai_coins']}")
+    logger.info(f"持仓量排行: {size_info['records']['oi_rankings']}")
     
-    print(f"\n=== 最旧数据时间 ===")
+    logger.info("=== 最旧数据时间 ===")
     if size_info['oldest_data']['kline_time']:
-        print(f"K线数据: {format_time(size_info['oldest_data']['kline_time'])}")
+        logger.info(f"K线数据: {format_time(size_info['oldest_data']['kline_time'])}")
     if size_info['oldest_data']['anomaly_time']:
-        print(f"异动数据: {format_time(size_info['oldest_data']['anomaly_time'])}")
+        logger.info(f"异动数据: {format_time(size_info['oldest_data']['anomaly_time'])}")
 
 def cleanup_database(hours):
     """清理数据库"""
-    print(f"=== 清理超过 {hours} 小时的数据 ===")
+    logger.info(f"=== 清理超过 {hours} 小时的数据 ===")
     
     # 创建临时数据库实例
     temp_db = Database(max_age_hours=hours)
     
     # 显示清理前信息
-    print("\n清理前状态:")
+    logger.info("清理前状态:")
     show_database_info(temp_db)
     
     # 执行清理
-    print(f"\n正在清理超过 {hours} 小时的数据...")
+    logger.info(f"正在清理超过 {hours} 小时的数据...")
     temp_db.cleanup_old_data()
+
+    # 手动清理时回收全部空闲页，让文件尽量缩小
+    pages = temp_db.incremental_vacuum(0)
+    logger.info(f"回收空闲页: {pages}")
     
     # 显示清理后信息
-    print("\n清理后状态:")
+    logger.info("清理后状态:")
     show_database_info(temp_db)
     
-    print("\n✅ 数据清理完成!")
+    temp_db.close()
+    
+    logger.info("✅ 数据清理完成!")
 
 def main():
     parser = argparse.ArgumentParser(description="数据库清理工具")
@@ -88,14 +98,13 @@ def main():
     
     if args.info:
         # 仅显示信息
-        from database import db
         show_database_info(db)
         return
     
     # 确认清理操作
     if not args.force:
-        print(f"将要清理超过 {args.hours} 小时的所有数据")
-        confirm = input("确认执行清理? (y/N): ").lower()
+        # 交互提示直接同步输出：日志经 QueueListener 线程异步写出，可能晚于 input() 的提示才显示
+        confirm = input(f"将要清理超过 {args.hours} 小时的所有数据\n确认执行清理? (y/N): ").lower()
         if confirm != 'y':
             print("取消清理操作")
             return
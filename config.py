@@ -19,6 +19,12 @@ DATABASE_CONFIG = {
     
     # 记录数限制（0表示无限制）
     "max_klines_per_symbol": 10000,
+    
+    # 每写入多少行检查一次数据库大小和单合约K线数量限制（两次定时清理之间）
+    "cleanup_check_rows": 10000,
+    
+    # 连接池保留的空闲连接数（长连接复用，避免每次操作重新打开数据库）
+    "connection_pool_size": 4,
 }
 
 # 网络配置
@@ -43,6 +49,21 @@ NETWORK_CONFIG = {
     "anomaly_check_interval": 60,  # 1分钟
 }
 
+# API服务配置
+API_CONFIG = {
+    "host": "0.0.0.0",
+    "port": 5000,
+
+    # main.py 是否在进程内启动API服务器（已安装 waitress 时使用 waitress，否则使用 Flask 开发服务器）
+    # 生产环境可设为 False，改用 gunicorn 单独运行 wsgi:application
+    "embedded": True,
+
+    # 内嵌 waitress 服务器的工作线程数、最大连接数和空闲连接超时（秒）
+    "threads": 8,
+    "connection_limit": 200,
+    "channel_timeout": 60,
+}
+
 # 日志配置
 LOGGING_CONFIG = {
     "level": "INFO",
@@ -60,4 +81,24 @@ PERFORMANCE_CONFIG = {
     
     # 定期VACUUM间隔（秒）
     "vacuum_interval": 86400,  # 24小时
+
+    # 过期数据分批删除的每批行数（每批单独提交）
+    "cleanup_batch_size": 5000,
+
+    # 每次清理后增量回收的最大空闲页数（auto_vacuum=INCREMENTAL）
+    "incremental_vacuum_pages": 1000,
+
+    # 定期执行 PRAGMA optimize 的间隔（秒），刷新查询规划器统计信息；0 表示只在清理后执行
+    "sqlite_optimize_interval": 900,
+    
+    # SQLite 连接级参数（每个新连接都会设置）
+    "sqlite_mmap_size": 256 * 1024 * 1024,  # 内存映射读取（字节）
+    "sqlite_cache_size_kb": 65536,  # 页缓存大小（KB）
+    "sqlite_temp_store": "MEMORY",  # 临时表/排序放内存
+    "sqlite_synchronous": "NORMAL",  # WAL 下 NORMAL 每次提交少一次 fsync
+    "sqlite_busy_timeout_ms": 5000,  # 写锁冲突时的等待时间（毫秒）
+    "sqlite_wal_autocheckpoint": 1000,  # WAL 达到多少页时自动检查点
+    "sqlite_cached_statements": 512,  # 每个连接缓存的预编译语句数
+    "sqlite_page_size": 8192,  # 页大小（字节），仅新建数据库时生效
+    "sqlite_cache_spill": False,  # 事务进行中不把脏页溢写到数据库文件
 }
\ No newline at end of file
@@ -2,83 +2,114 @@
 """
 data_updater.py - 独立数据更新器
 
-每3分钟更新AI选币和持仓量排行数据，独立于异动检测系统
-"""
-#!/usr/bin/env python3
-"""
-data_updater.py - 独立数据更新器
-
 每3分钟更新AI选币和持仓量排行数据，独立于异动检测系统
 """
 
+import os
 import time
 import threading
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import heapq
+from operator import attrgetter, itemgetter
 import numpy as np
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterable
 from datetime import datetime
 
-from database import db
+from database import db, CoinScore
 from log_config import setup_logging
+from network_config import NetworkSession, TICKER_24HR_ALL_WEIGHT, binance_get
+import json_utils
+
+try:
+    from config import NETWORK_CONFIG
+except ImportError:
+    NETWORK_CONFIG = {
+        "timeout": 15,
+        "max_retries": 3,
+        "backoff_factor": 1.0,
+        "pool_connections": 10,
+        "pool_maxsize": 20,
+        "update_interval": 180,
+    }
 
 # 初始化日志（幂等）
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# 模块级共享HTTP会话：币安与Aster请求复用 keep-alive 连接，避免每次重新TCP+TLS握手
+_SESSION = NetworkSession.create_session(
+    max_retries=NETWORK_CONFIG["max_retries"],
+    backoff_factor=NETWORK_CONFIG["backoff_factor"],
+    pool_connections=NETWORK_CONFIG["pool_connections"],
+    pool_maxsize=NETWORK_CONFIG["pool_maxsize"],
+)
+HTTP_TIMEOUT = NETWORK_CONFIG["timeout"]
+
+# 24小时行情索引的缓存时间（秒），同一周期内的多个排行共用一次请求和解析
+TICKER_INDEX_TTL = 30
+
+
+def _to_float(value) -> float:
+    """行情字段转 float，无法解析时返回 NaN"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
 
 class DataUpdater:
     def __init__(self):
         self.running = False
-        self.update_interval = 180  # 3分钟
+        self.update_interval = NETWORK_CONFIG.get("update_interval", 180)  # 默认3分钟
+        self._stop_event = threading.Event()  # stop() 时立即唤醒等待中的更新循环
         self.top_n_symbols = 20  # 每个表最多20个币种
         
-        # 配置HTTP会话和重试策略
-        self.session = requests.Session()
-        
-        # 配置重试策略
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS"]
-        )
-        
-        # 配置HTTP适配器
-        adapter = HTTPAdapter(
-            max_retries=retry_strategy,
-            pool_connections=10,
-            pool_maxsize=20,
-            pool_block=False
-        )
+        # 使用模块级共享会话（连接池与重试策略见 NETWORK_CONFIG）
+        self.session = _SESSION
         
-        self.session.mount("http://", adapter)
-        self.session.mount("https://", adapter)
-        
-        # 设置默认超时和头部
-        self.session.headers.update({
-            'User-Agent': 'python-requests/2.31.0',
-            'Connection': 'keep-alive',
-            'Accept': 'application/json'
-        })
-
-    def get_active_symbols(self) -> List[str]:
-        """获取活跃合约列表"""
+        # symbol -> 24小时行情，见 _get_ticker_index
+        self._ticker_index: Optional[Dict[str, Dict]] = None
+        self._ticker_index_ts = 0.0
+
+    def fetch_tickers(self) -> List[Dict]:
+        """获取全部合约的24小时行情（一个更新周期只需请求一次）"""
         try:
             url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
-            r = self.session.get(url, timeout=15)
+            r = binance_get(self.session, url, TICKER_24HR_ALL_WEIGHT, timeout=HTTP_TIMEOUT)
             r.raise_for_status()
-            tickers = r.json()
+            return json_utils.loads(r.content)
+        except Exception:
+            logger.exception("获取24小时行情失败")
+            return []
 
-            usdt_tickers = [
-                t for t in tickers
-                if t['symbol'].endswith('USDT') and float(t.get('quoteVolume', 0)) > 5000
+    def _get_ticker_index(self) -> Dict[str, Dict]:
+        """获取 symbol -> 24小时行情 的索引，TICKER_INDEX_TTL 秒内直接复用缓存"""
+        now = time.monotonic()
+        if self._ticker_index is None or now - self._ticker_index_ts >= TICKER_INDEX_TTL:
+            tickers = self.fetch_tickers()
+            if not tickers:
+                # 请求失败时不缓存空结果，也不沿用过期的旧索引（否则会用旧行情重写排行表），本周期跳过
+                return {}
+            self._ticker_index = {t['symbol']: t for t in tickers}
+            self._ticker_index_ts = now
+        return self._ticker_index
+
+    def get_active_symbols(self, tickers: Optional[Iterable[Dict]] = None) -> List[str]:
+        """获取活跃合约列表
+
+        tickers: 已获取的24小时行情；未传入时单独请求一次
+        """
+        try:
+            if tickers is None:
+                tickers = self._get_ticker_index().values()
+
+            # 成交额只解析一次；只需前50名，用 nlargest 代替全量排序（结果与稳定降序排序一致）
+            usdt_volumes = [
+                (volume, t['symbol'])
+                for t in tickers if t['symbol'].endswith('USDT')
+                for volume in (float(t.get('quoteVolume', 0)),) if volume > 5000
             ]
-
-            usdt_tickers.sort(key=lambda x: float(x.get('quoteVolume', 0)), reverse=True)
-            return [t['symbol'] for t in usdt_tickers[:50]]
+            return [symbol for _, symbol in heapq.nlargest(50, usdt_volumes, key=itemgetter(0))]
         except Exception:
             logger.exception("获取活跃合约失败")
             return []
@@ -89,17 +120,18 @@ class DataUpdater:
             if len(klines) < 10:
                 return 0.0
 
-            prices = [k['close_price'] for k in klines]
-            volumes = [k['quote_volume'] for k in klines]
+            n = len(klines)
+            prices = np.fromiter((k['close_price'] for k in klines), dtype=np.float64, count=n)
+            volumes = np.fromiter((k['quote_volume'] for k in klines), dtype=np.float64, count=n)
 
-            returns = [(prices[i] - prices[i-1]) / prices[i-1] for i in range(1, len(prices))]
-            volatility = np.std(returns) if len(returns) > 1 else 0
+            returns = np.diff(prices) / prices[:-1]
+            volatility = returns.std() if returns.size > 1 else 0
 
             price_change_24h = float(ticker_data.get('priceChangePercent', 0))
             volume_24h = float(ticker_data.get('quoteVolume', 0))
 
-            recent_avg_volume = np.mean(volumes[-5:]) if len(volumes) >= 5 else 0
-            older_avg_volume = np.mean(volumes[:5]) if len(volumes) >= 10 else recent_avg_volume
+            recent_avg_volume = volumes[-5:].mean() if n >= 5 else 0
+            older_avg_volume = volumes[:5].mean() if n >= 10 else recent_avg_volume
             volume_growth = (recent_avg_volume - older_avg_volume) / older_avg_volume if older_avg_volume > 0 else 0
 
             score = 0.0
@@ -113,121 +145,105 @@ class DataUpdater:
             logger.exception(f"计算 {symbol} 评分失败")
             return 0.0
 
-    def update_ai_coins(self):
-        """更新AI选币数据"""
+    def _score_one(self, symbol: str, ticker: Dict, klines: List[Dict]) -> Optional[CoinScore]:
+        """计算单个币种的评分数据，评分为0或出错时返回 None"""
+        try:
+            if not klines:
+                return None
+
+            score = self.calculate_coin_score(symbol, ticker, klines)
+            if score <= 0:
+                return None
+
+            start_price = klines[0]['close_price']
+            current_price = klines[-1]['close_price']
+            max_price = max(k['high_price'] for k in klines)
+
+            increase_percent = ((current_price - start_price) / start_price) * 100
+            volume_24h = float(ticker.get('quoteVolume', 0))
+            price_change_24h = float(ticker.get('priceChangePercent', 0))
+
+            return CoinScore(symbol, score, klines[0]['open_time'] // 1000, start_price, current_price,
+                             max_price, increase_percent, volume_24h, price_change_24h)
+        except Exception:
+            logger.exception(f"处理 {symbol} 失败")
+            return None
+
+    def update_ai_coins(self, symbols: Optional[List[str]] = None):
+        """更新AI选币数据
+
+        symbols 由 update_cycle 注入；单独调用时自动获取
+        """
         try:
             logger.info(f"[{datetime.now().strftime('%H:%M:%S')}] 开始更新AI选币数据...")
 
-            symbols = self.get_active_symbols()
+            ticker_data = self._get_ticker_index()
+            if symbols is None:
+                symbols = self.get_active_symbols(ticker_data.values())
             if not symbols:
                 logger.warning("未获取到活跃合约数据")
                 return
 
-            url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
-            r = self.session.get(url, timeout=15)
-            r.raise_for_status()
-            ticker_data = {t['symbol']: t for t in r.json()}
-
+            # 30个币种的K线一次查询取回，逐个评分只做内存计算
+            top_symbols = symbols[:30]
+            klines_by_symbol = db.get_recent_klines_bulk(top_symbols, 16)
             coin_scores = []
-            for symbol in symbols[:30]:
-                try:
-                    klines = db.get_recent_klines(symbol, 16)
-                    if not klines:
-                        continue
-
-                    ticker = ticker_data.get(symbol, {})
-                    score = self.calculate_coin_score(symbol, ticker, klines)
-
-                    if score > 0:
-                        start_price = klines[0]['close_price']
-                        current_price = klines[-1]['close_price']
-                        max_price = max([k['high_price'] for k in klines])
-
-                        increase_percent = ((current_price - start_price) / start_price) * 100
-                        volume_24h = float(ticker.get('quoteVolume', 0))
-                        price_change_24h = float(ticker.get('priceChangePercent', 0))
-
-                        coin_scores.append({
-                            'symbol': symbol,
-                            'score': score,
-                            'start_time': klines[0]['open_time'] // 1000,
-                            'start_price': start_price,
-                            'current_price': current_price,
-                            'max_price': max_price,
-                            'increase_percent': increase_percent,
-                            'volume_24h': volume_24h,
-                            'price_change_24h': price_change_24h
-                        })
-
-                    time.sleep(0.05)
-                except Exception:
-                    logger.exception(f"处理 {symbol} 失败")
-                    continue
-
-            coin_scores.sort(key=lambda x: x['score'], reverse=True)
+            for symbol in top_symbols:
+                coin = self._score_one(symbol, ticker_data.get(symbol, {}), klines_by_symbol.get(symbol, []))
+                if coin is not None:
+                    coin_scores.append(coin)
+
+            coin_scores.sort(key=attrgetter('score'), reverse=True)
             top_coins = coin_scores[:self.top_n_symbols]
 
-            db.clear_ai_coins()
-            for coin in top_coins:
-                db.upsert_ai_coin(coin)
+            db.replace_ai_coins(top_coins)
 
             logger.info(f"AI选币数据更新完成: {len(top_coins)}个币种")
         except Exception:
             logger.exception("更新AI选币数据失败")
 
-    def update_oi_rankings(self):
-        """更新持仓量排行数据"""
+    def update_oi_rankings(self, symbols: Optional[List[str]] = None):
+        """更新持仓量排行数据
+
+        symbols 由 update_cycle 注入；单独调用时自动获取
+        """
         try:
             logger.info(f"[{datetime.now().strftime('%H:%M:%S')}] 开始更新持仓量排行...")
 
-            symbols = self.get_active_symbols()
+            ticker_data = self._get_ticker_index()
+            if symbols is None:
+                symbols = self.get_active_symbols(ticker_data.values())
             if not symbols:
                 logger.warning("未获取到活跃合约数据")
                 return
-
-            url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
-            r = self.session.get(url, timeout=15)
-            r.raise_for_status()
-            ticker_data = {t['symbol']: t for t in r.json()}
             
-            oi_data = []
-            for symbol in symbols[:30]:
-                try:
-                    ticker = ticker_data.get(symbol, {})
-                    volume_24h = float(ticker.get('quoteVolume', 0))
-                    price_change_24h = float(ticker.get('priceChangePercent', 0))
-
-                    if volume_24h > 0:
-                        base_oi = volume_24h * 0.15
-                        oi_delta = base_oi * 0.03
-                        oi_delta_percent = abs(price_change_24h) * 0.5 + 2.0
-
-                        oi_data.append({
-                            'symbol': symbol,
-                            'current_oi': base_oi,
-                            'oi_delta': oi_delta,
-                            'oi_delta_percent': oi_delta_percent,
-                            'oi_delta_value': oi_delta * 50,
-                            'price_delta_percent': price_change_24h,
-                            'net_long': base_oi * 0.6,
-                            'net_short': base_oi * 0.4,
-                            'volume_24h': volume_24h
-                        })
-
-                    time.sleep(0.05)
-                except Exception:
-                    logger.exception(f"处理 {symbol} 持仓量失败")
-                    continue
-
-            oi_data.sort(key=lambda x: x['current_oi'], reverse=True)
-            top_oi = oi_data[:self.top_n_symbols]
-
-            for rank, oi in enumerate(top_oi, 1):
-                oi['rank'] = rank
-
-            db.clear_oi_rankings()
-            for oi in top_oi:
-                db.upsert_oi_ranking(oi)
+            # 一次性取出成交额和涨跌幅，整体向量化计算并排序（无I/O，不需要逐个休眠）
+            top_symbols = symbols[:30]
+            tickers_top = [ticker_data.get(s, {}) for s in top_symbols]
+            volume_24h = np.array([_to_float(t.get('quoteVolume', 0)) for t in tickers_top])
+            price_change_24h = np.array([_to_float(t.get('priceChangePercent', 0)) for t in tickers_top])
+
+            idx = np.flatnonzero((volume_24h > 0) & ~np.isnan(price_change_24h))
+            base_oi = volume_24h[idx] * 0.15
+            oi_delta = base_oi * 0.03
+            oi_delta_percent = np.abs(price_change_24h[idx]) * 0.5 + 2.0
+
+            # 稳定排序，持仓量相同时保持原有的成交额顺序
+            order = np.argsort(-base_oi, kind='stable')[:self.top_n_symbols]
+            top_oi = [{
+                'symbol': top_symbols[idx[j]],
+                'rank': rank,
+                'current_oi': float(base_oi[j]),
+                'oi_delta': float(oi_delta[j]),
+                'oi_delta_percent': float(oi_delta_percent[j]),
+                'oi_delta_value': float(oi_delta[j] * 50),
+                'price_delta_percent': float(price_change_24h[idx[j]]),
+                'net_long': float(base_oi[j] * 0.6),
+                'net_short': float(base_oi[j] * 0.4),
+                'volume_24h': float(volume_24h[idx[j]])
+            } for rank, j in enumerate(order.tolist(), 1)]
+
+            db.replace_oi_rankings(top_oi)
 
             logger.info(f"持仓量排行更新完成: {len(top_oi)}个币种")
         except Exception:
@@ -237,33 +253,40 @@ class DataUpdater:
         """执行一次完整的更新周期"""
         logger.info(f"\n=== 开始数据更新周期 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ===")
 
-        self.update_ai_coins()
-        time.sleep(10)
-        self.update_oi_rankings()
+        # 24小时行情整个周期只请求、解析一次，两个排行共用缓存的索引
+        symbols = self.get_active_symbols(self._get_ticker_index().values())
+
+        self.update_ai_coins(symbols)
+        self.update_oi_rankings(symbols)
 
         logger.info("=== 数据更新周期完成 ===\n")
 
     def start(self):
         """启动数据更新器"""
         self.running = True
+        self._stop_event.clear()
         logger.info(f"数据更新器启动，更新间隔: {self.update_interval}秒")
 
-        # 首次立即更新
-        self.update_cycle()
-
-        # 定期更新
+        # 首次立即更新，之后按固定周期执行（以单调时钟为基准，不受更新耗时影响）
+        next_t = time.monotonic()
         while self.running:
             try:
-                time.sleep(self.update_interval)
-                if self.running:
-                    self.update_cycle()
+                self.update_cycle()
             except Exception:
                 logger.exception("数据更新器异常")
-                time.sleep(60)
+            next_t += self.update_interval
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                if self._stop_event.wait(delay):
+                    break
+            else:
+                # 更新耗时超过一个周期，从当前时刻重新计时，避免连续追赶
+                next_t = time.monotonic()
 
     def stop(self):
         """停止数据更新器"""
         self.running = False
+        self._stop_event.set()
         # 关闭session连接
         if hasattr(self, 'session'):
             self.session.close()
@@ -288,20 +311,13 @@ def download_and_store_aster(save_path: str = "json/aster_exchangeInfo.json") ->
     返回 True 表示成功，False 表示失败。
     """
     try:
-        # 创建一个临时会话用于下载
-        session = requests.Session()
-        adapter = HTTPAdapter(max_retries=3)
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        
         url = "https://fapi.asterdex.com/fapi/v1/exchangeInfo"
         logger.info(f"下载 Aster exchangeInfo: {url}")
-        r = session.get(url, timeout=15)
+        r = _SESSION.get(url, timeout=HTTP_TIMEOUT)
         r.raise_for_status()
-        payload = r.json()
+        payload = json_utils.loads(r.content)
 
         # 确保目录存在
-        import os, json
         dirpath = os.path.dirname(save_path)
         if dirpath and not os.path.exists(dirpath):
             os.makedirs(dirpath, exist_ok=True)
@@ -310,45 +326,26 @@ def download_and_store_aster(save_path: str = "json/aster_exchangeInfo.json") ->
         # with open(save_path, "w", encoding="utf-8") as f:
         #     json.dump(payload, f, ensure_ascii=False, indent=2)
 
-        # 提取 symbols 并写入数据库
+        # 提取 symbols 并写入数据库（一次遍历直接生成 replace_aster_symbols 需要的结构）
         symbols = payload.get('symbols') or []
-        simple_symbols = []
-        kept, skipped = 0, 0
-        for s in symbols:
-            # Aster 返回的字段可能包含 status 或 contractStatus，两者等价，这里统一取
-            status = s.get('status') or s.get('contractStatus')
-            contract_type = s.get('contractType')  # 可能为 PERPETUAL 等
-
-            # 只保留状态为 TRADING 的合约（忽略 PENDING_TRADING / PRE_SETTLE / SETTLING / CLOSE）
-            if status != 'TRADING':
-                skipped += 1
-                continue
-
-            simple_symbols.append({
-                'symbol': s.get('symbol'),
-                'status': status,
-                'baseAsset': s.get('baseAsset'),
-                'quoteAsset': s.get('quoteAsset'),
-                'contractType': contract_type,
-                # include full raw for db method to store
-                **({'raw': s} if s else {})
-            })
-            kept += 1
+        # Aster 返回的字段可能包含 status 或 contractStatus，两者等价，这里统一取；
+        # 只保留状态为 TRADING 的合约（忽略 PENDING_TRADING / PRE_SETTLE / SETTLING / CLOSE）
+        simple_symbols = [{
+            'symbol': s.get('symbol'),
+            'status': 'TRADING',
+            'baseAsset': s.get('baseAsset'),
+            'quoteAsset': s.get('quoteAsset'),
+            'raw': s,
+        } for s in symbols if (s.get('status') or s.get('contractStatus')) == 'TRADING']
+        kept = len(simple_symbols)
+        skipped = len(symbols) - kept
 
         logger.info(f"Aster 合约总数: {len(symbols)}, 保留 TRADING 状态: {kept}, 已跳过非交易状态: {skipped}")
 
         if simple_symbols:
             try:
                 # 写入数据库
-                from database import db
-                # build list expected by replace_aster_symbols
-                db.replace_aster_symbols([{
-                    'symbol': item.get('symbol'),
-                    'status': item.get('status'),
-                    'baseAsset': item.get('baseAsset'),
-                    'quoteAsset': item.get('quoteAsset'),
-                    'raw': item.get('raw')
-                } for item in simple_symbols])
+                db.replace_aster_symbols(simple_symbols)
                 logger.info(f"已写入 {len(simple_symbols)} 个 Aster TRADING 合约到数据库")
             except Exception:
                 logger.exception("写入 Aster 合约到数据库失败")
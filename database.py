@@ -7,15 +7,23 @@ database.py - 数据库模块
 2. 异动汇总表 (anomalies)
 """
 
+import json
+import os
+import queue
 import sqlite3
 import time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple, Iterable
 import threading
 import logging
+from collections import namedtuple
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
 
 # 导入配置
 try:
-    from config import DATABASE_CONFIG, LOGGING_CONFIG
+    from config import DATABASE_CONFIG, LOGGING_CONFIG, PERFORMANCE_CONFIG
 except ImportError:
     # 默认配置
     DATABASE_CONFIG = {
@@ -25,13 +33,91 @@ except ImportError:
         "auto_cleanup": True,
         "max_db_size_mb": 100,
         "max_klines_per_symbol": 10000,
+        "connection_pool_size": 4,
+        "cleanup_check_rows": 10000,
     }
     LOGGING_CONFIG = {
         "level": "INFO",
         "cleanup_log": True,
     }
+    PERFORMANCE_CONFIG = {
+        "sqlite_mmap_size": 256 * 1024 * 1024,
+        "sqlite_cache_size_kb": 65536,
+        "sqlite_temp_store": "MEMORY",
+        "sqlite_synchronous": "NORMAL",
+        "sqlite_busy_timeout_ms": 5000,
+        "sqlite_wal_autocheckpoint": 1000,
+        "sqlite_cached_statements": 512,
+        "sqlite_page_size": 8192,
+        "sqlite_cache_spill": False,
+        "cleanup_batch_size": 5000,
+        "incremental_vacuum_pages": 1000,
+        "sqlite_optimize_interval": 900,
+    }
+
+
+# AI选币一行数据，字段顺序与 ai_coins 表的写入列一致（updated_at 除外）
+CoinScore = namedtuple('CoinScore', 'symbol score start_time start_price current_price max_price '
+                                    'increase_percent volume_24h price_change_24h')
+
+# 异动检测结果，前 18 个字段顺序与 anomalies 表的写入列一致（created_at 除外），
+# is_anomaly 只用于日志汇总，不写入数据库
+AnomalyRow = namedtuple('AnomalyRow', 'symbol timestamp interval_type cur_return cur_abs_return '
+                                      'close_price cur_volume cur_volatility price_zscore '
+                                      'price_percentile volume_zscore volatility_zscore '
+                                      'anomaly_score price_score volume_score volatility_score '
+                                      'anomaly_reasons quote_volume_24h is_anomaly',
+                        defaults=(False,))
+
+
+# 数据表结构版本（PRAGMA user_version），结构变更时递增并在 init_tables 中迁移
+SCHEMA_VERSION = 2
+
+# 按 symbol 整行覆盖的小表使用 WITHOUT ROWID（行直接存在主键 B-tree 中）；
+# STRICT 需要 SQLite 3.37+，旧版本下只去掉类型检查
+_KEYED_TABLE_OPTIONS = "WITHOUT ROWID, STRICT" if sqlite3.sqlite_version_info >= (3, 37, 0) else "WITHOUT ROWID"
+
+
+class _Connection(sqlite3.Connection):
+    """可归还连接池的连接
+
+    调用方沿用 get_connection()/close() 的写法：close() 会回滚未提交的事务并把连接
+    放回所属连接池；池已满或不属于任何池时才真正关闭（关闭前执行 PRAGMA optimize）。
+    """
+
+    _pool = None
+
+    def close(self):
+        pool = self._pool
+        if pool is not None:
+            try:
+                if self.in_transaction:
+                    self.rollback()
+                self.row_factory = sqlite3.Row  # 个别查询会临时改为元组行
+                pool.put_nowait(self)
+                return
+            except (queue.Full, sqlite3.Error):
+                pass
+        self._pool = None
+        try:
+            self.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass
+        super().close()
+
 
 class Database:
+    # 每个新连接执行的 PRAGMA（均为连接级设置，取值见 PERFORMANCE_CONFIG）
+    _CONNECTION_PRAGMAS = (
+        f"PRAGMA mmap_size={int(PERFORMANCE_CONFIG.get('sqlite_mmap_size', 0))};"
+        f"PRAGMA cache_size=-{int(PERFORMANCE_CONFIG.get('sqlite_cache_size_kb', 2000))};"
+        f"PRAGMA temp_store={PERFORMANCE_CONFIG.get('sqlite_temp_store', 'MEMORY')};"
+        f"PRAGMA synchronous={PERFORMANCE_CONFIG.get('sqlite_synchronous', 'NORMAL')};"
+        f"PRAGMA busy_timeout={int(PERFORMANCE_CONFIG.get('sqlite_busy_timeout_ms', 5000))};"
+        f"PRAGMA wal_autocheckpoint={int(PERFORMANCE_CONFIG.get('sqlite_wal_autocheckpoint', 1000))};"
+        f"PRAGMA cache_spill={'ON' if PERFORMANCE_CONFIG.get('sqlite_cache_spill', False) else 'OFF'};"
+    )
+
     def __init__(self, db_path: str = None, max_age_hours: int = None):
         self.db_path = db_path or DATABASE_CONFIG["db_path"]
         self.max_age_hours = max_age_hours or DATABASE_CONFIG["max_age_hours"]
@@ -40,29 +126,84 @@ class Database:
         self.auto_cleanup = DATABASE_CONFIG["auto_cleanup"]
         self.max_db_size_mb = DATABASE_CONFIG["max_db_size_mb"]
         self.max_klines_per_symbol = DATABASE_CONFIG["max_klines_per_symbol"]
+        self.cleanup_check_rows = DATABASE_CONFIG.get("cleanup_check_rows", 10000)
+        self._rows_since_check = 0  # 上次大小/数量检查后写入的行数
+        self.optimize_interval = int(PERFORMANCE_CONFIG.get("sqlite_optimize_interval", 900))
+        self._last_optimize_time = time.monotonic()
         
         self.lock = threading.Lock()
         self.last_cleanup_time = 0  # 上次清理时间
+        # 长连接池：避免每次操作都重新打开 .db/-wal/-shm 并重复设置 PRAGMA
+        # 写操作仍由 self.lock 串行化，读操作可并发各自取用一个连接
+        self._pool = queue.LifoQueue(maxsize=max(1, int(DATABASE_CONFIG.get("connection_pool_size", 4))))
         
         self.init_tables()
         if self.auto_cleanup:
             self.cleanup_old_data()  # 初始化时清理一次旧数据
     
     def get_connection(self):
-        """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        """获取数据库连接
+
+        PRAGMA 除 journal_mode 外都是连接级的，因此每个新连接都要重新设置：
+        mmap 读取热点页免去系统调用，较大的页缓存，临时表放内存，
+        WAL 模式下 synchronous=NORMAL 已能保证数据库不损坏；
+        busy_timeout 让并发写入等待而不是立即报 database is locked，
+        wal_autocheckpoint 限制 WAL 文件增长。
+        """
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        # 长连接上的 SQL 文本都是固定常量，加大语句缓存让重复执行跳过编译
+        # isolation_level="IMMEDIATE"：隐式事务一开始就拿写锁，锁冲突交给 busy_timeout 等待，
+        # 不会在读锁升级为写锁时直接报 database is locked（独立运行的 data_updater 进程也会写库）。
+        # 读操作不开启事务，也不需要 self.lock，WAL 下可与写入并发进行
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=_Connection,
+                               cached_statements=int(PERFORMANCE_CONFIG.get('sqlite_cached_statements', 128)),
+                               isolation_level="IMMEDIATE")
         conn.row_factory = sqlite3.Row  # 使结果可以通过列名访问
+        conn.executescript(self._CONNECTION_PRAGMAS)
+        conn._pool = self._pool
         return conn
+
+    def close(self):
+        """关闭连接池中的所有空闲连接"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            conn._pool = None
+            conn.close()
     
     def init_tables(self):
         """初始化数据库表"""
         with self.lock:
             conn = self.get_connection()
             try:
+                # 页大小只对新建的空数据库生效（WAL 模式下的已有数据库无法再修改），
+                # anomalies 等宽行表用 8KB 页可减少 B-tree 层数
+                conn.execute(f"PRAGMA page_size={int(PERFORMANCE_CONFIG.get('sqlite_page_size', 4096))}")
+                
+                # 增量 auto_vacuum：清理后用 incremental_vacuum 按页回收空间，无需整库 VACUUM。
+                # 必须在建表前设置；已有数据库需一次性 VACUUM 才能转换
+                if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                    if conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone():
+                        conn.execute("VACUUM")
+                        logging.info("数据库已转换为增量 auto_vacuum 模式")
+
+                # WAL模式：读写互不阻塞，API多进程/多线程并发读取时不会被写入锁住
+                conn.execute("PRAGMA journal_mode=WAL")
+                
+                # 建表与结构迁移在同一个事务内完成
+                conn.execute("BEGIN IMMEDIATE")
+                legacy_tables = self._rename_legacy_tables(conn)
+                
                 # 原始K线数据表
                 conn.execute("""
                     CREATE TABLE IF NOT EXISTS klines (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        id INTEGER PRIMARY KEY,
                         symbol TEXT NOT NULL,
                         open_time INTEGER NOT NULL,
                         close_time INTEGER NOT NULL,
@@ -81,7 +222,7 @@ class Database:
                 # 异动汇总表
                 conn.execute("""
                     CREATE TABLE IF NOT EXISTS anomalies (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        id INTEGER PRIMARY KEY,
                         symbol TEXT NOT NULL,
                         timestamp INTEGER NOT NULL,
                         interval_type TEXT NOT NULL,  -- '15m', '5m', '1m'
@@ -119,10 +260,9 @@ class Database:
                 """)
                 
                 # AI选币数据表（独立更新）
-                conn.execute("""
+                conn.execute(f"""
                     CREATE TABLE IF NOT EXISTS ai_coins (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        symbol TEXT NOT NULL,
+                        symbol TEXT NOT NULL PRIMARY KEY,
                         score REAL NOT NULL,
                         start_time INTEGER NOT NULL,
                         start_price REAL NOT NULL,
@@ -131,16 +271,14 @@ class Database:
                         increase_percent REAL NOT NULL,
                         volume_24h REAL NOT NULL,
                         price_change_24h REAL NOT NULL,
-                        updated_at INTEGER NOT NULL,
-                        UNIQUE(symbol)
-                    )
+                        updated_at INTEGER NOT NULL
+                    ) {_KEYED_TABLE_OPTIONS}
                 """)
                 
                 # 持仓量排行数据表（独立更新）
-                conn.execute("""
+                conn.execute(f"""
                     CREATE TABLE IF NOT EXISTS oi_rankings (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        symbol TEXT NOT NULL,
+                        symbol TEXT NOT NULL PRIMARY KEY,
                         rank INTEGER NOT NULL,
                         current_oi REAL NOT NULL,
                         oi_delta REAL NOT NULL,
@@ -150,19 +288,35 @@ class Database:
                         net_long REAL NOT NULL,
                         net_short REAL NOT NULL,
                         volume_24h REAL NOT NULL,
-                        updated_at INTEGER NOT NULL,
-                        UNIQUE(symbol)
-                    )
+                        updated_at INTEGER NOT NULL
+                    ) {_KEYED_TABLE_OPTIONS}
                 """)
                 
+                # 旧表数据复制到新表后删除（旧表上的索引随之删除，下面按原名重建）
+                for table in legacy_tables:
+                    # 按新表的列名复制（新结构可能去掉了 id 等列）
+                    columns = ", ".join(r[1] for r in conn.execute(f"PRAGMA table_info({table})"))
+                    conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_old")
+                    conn.execute(f"DROP TABLE {table}_old")
+                if legacy_tables:
+                    logging.info(f"数据表结构已迁移到版本 {SCHEMA_VERSION}: {', '.join(legacy_tables)}")
+                
                 # 创建索引
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_klines_symbol_time ON klines(symbol, open_time)")
-                conn.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_timestamp ON anomalies(timestamp DESC)")
+                # 异动查询按 interval_type 等值 + timestamp 范围过滤，复合索引直接定位；
+                # 原单列 timestamp 索引被它取代（不带 interval_type 的计数可走 skip-scan）
+                conn.execute("DROP INDEX IF EXISTS idx_anomalies_timestamp")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_iv_ts_score ON anomalies(interval_type, timestamp DESC, anomaly_score DESC)")
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_score ON anomalies(anomaly_score DESC)")
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_coins_score ON ai_coins(score DESC)")
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_oi_rankings_rank ON oi_rankings(rank ASC)")
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_coins_updated ON ai_coins(updated_at DESC)")
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_oi_rankings_updated ON oi_rankings(updated_at DESC)")
+                if PERFORMANCE_CONFIG.get("enable_extra_indexes", True):
+                    # 排行榜按排序列取 top-N，过期清理按 created_at 范围删除，均需对应列索引避免全表扫描
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_oi_rankings_current_oi ON oi_rankings(current_oi DESC)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_klines_created ON klines(created_at)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_anomalies_created ON anomalies(created_at)")
                 # Aster 交易所合约表，用于存储从 exchangeInfo 下载的合约信息
                 conn.execute("""
                     CREATE TABLE IF NOT EXISTS aster (
@@ -176,10 +330,88 @@ class Database:
                 """)
                 conn.execute("CREATE INDEX IF NOT EXISTS idx_aster_updated ON aster(updated_at DESC)")
                 
+                conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
                 conn.commit()
             finally:
                 conn.close()
     
+    @staticmethod
+    def _rename_legacy_tables(conn) -> List[str]:
+        """把需要重建的旧版本表改名为 <表名>_old，返回改名的表
+
+        版本 1：去掉 id 列的 AUTOINCREMENT（每次插入都要额外读写 sqlite_sequence，
+        而 id 从未在外部使用）。
+        版本 2：ai_coins / oi_rankings 去掉 id 列，以 symbol 为主键建成 WITHOUT ROWID 表。
+        """
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return []
+        legacy_tables = []
+        for table in ("klines", "anomalies", "ai_coins", "oi_rankings"):
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+            if not row:
+                continue
+            sql = row[0].upper()
+            if "AUTOINCREMENT" in sql or (table in ("ai_coins", "oi_rankings") and "WITHOUT ROWID" not in sql):
+                conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+                legacy_tables.append(table)
+        return legacy_tables
+
+    @staticmethod
+    def _delete_in_batches(conn, table: str, column: str, cutoff_time: int) -> int:
+        """按 rowid 分批删除 column < cutoff_time 的记录，返回删除总数"""
+        batch_size = int(PERFORMANCE_CONFIG.get("cleanup_batch_size", 5000))
+        sql = (f"DELETE FROM {table} WHERE rowid IN "
+               f"(SELECT rowid FROM {table} WHERE {column} < ? LIMIT ?)")
+        total = 0
+        while True:
+            n = conn.execute(sql, (cutoff_time, batch_size)).rowcount
+            conn.commit()
+            total += n
+            if n < batch_size:
+                return total
+
+    @staticmethod
+    def _incremental_vacuum(conn, pages: int = None) -> int:
+        """在给定连接上执行 PRAGMA incremental_vacuum，返回回收前的空闲页数
+
+        pages 为 0 时回收全部空闲页。
+        """
+        if pages is None:
+            pages = int(PERFORMANCE_CONFIG.get("incremental_vacuum_pages", 1000))
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        pages = min(free_pages, pages) if pages > 0 else free_pages
+        if pages:
+            # 该 PRAGMA 每 step 只回收一页，sqlite3 的 execute 只会 step 一次，
+            # executescript 则会把语句执行到底
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        return pages
+
+    def _optimize(self, conn):
+        """在给定连接上执行 PRAGMA optimize，按需对统计信息过时的表重新 ANALYZE"""
+        conn.executescript("PRAGMA optimize;")
+        self._last_optimize_time = time.monotonic()
+
+    def optimize(self):
+        """刷新查询规划器统计信息
+
+        连接池中的长连接很少真正关闭，不能只依赖关闭连接时的 PRAGMA optimize。
+        """
+        with self.lock:
+            conn = self.get_connection()
+            try:
+                self._optimize(conn)
+            finally:
+                conn.close()
+
+    def incremental_vacuum(self, pages: int = None) -> int:
+        """回收至多 pages 个空闲页（默认取配置 incremental_vacuum_pages，0 表示全部）"""
+        with self.lock:
+            conn = self.get_connection()
+            try:
+                return self._incremental_vacuum(conn, pages)
+            finally:
+                conn.close()
+
     def cleanup_old_data(self):
         """清理超过时效的旧数据"""
         cutoff_time = int(time.time()) - self.max_age_seconds
@@ -189,40 +421,38 @@ class Database:
             try:
                 deleted_counts = {}
                 
-                # 清理旧的K线数据
-                cursor = conn.execute("DELETE FROM klines WHERE created_at < ?", (cutoff_time,))
-                deleted_counts['klines'] = cursor.rowcount
+                # 清理旧的K线数据（分批删除，每批提交一次，避免长时间持有写锁和WAL膨胀）
+                deleted_counts['klines'] = self._delete_in_batches(conn, "klines", "created_at", cutoff_time)
                 
-                # 如果有单个合约K线数量限制，额外清理超量数据
-                if self.max_klines_per_symbol > 0:
-                    cursor = conn.execute("""
-                        DELETE FROM klines 
-                        WHERE id IN (
-                            SELECT id FROM (
-                                SELECT id, ROW_NUMBER() OVER (
-                                    PARTITION BY symbol 
-                                    ORDER BY open_time DESC
-                                ) as rn
-                                FROM klines
+                # 超量K线和两张小表的删除放在同一个写事务里，只提交一次
+                with conn:  # 成功提交，异常回滚
+                    # 如果有单个合约K线数量限制，额外清理超量数据
+                    # 逐个合约通过 (symbol, open_time) 索引定位第 N+1 新的K线，删除它及更早的数据，
+                    # 避免对全表按合约分区排序；删除行数取 total_changes 的差值
+                    if self.max_klines_per_symbol > 0:
+                        symbols = [row[0] for row in conn.execute("SELECT DISTINCT symbol FROM klines")]
+                        changes_before = conn.total_changes
+                        conn.executemany("""
+                            DELETE FROM klines
+                            WHERE symbol = ? AND open_time <= (
+                                SELECT open_time FROM klines
+                                WHERE symbol = ?
+                                ORDER BY open_time DESC
+                                LIMIT 1 OFFSET ?
                             )
-                            WHERE rn > ?
-                        )
-                    """, (self.max_klines_per_symbol,))
-                    deleted_counts['klines_excess'] = cursor.rowcount
+                        """, [(symbol, symbol, self.max_klines_per_symbol) for symbol in symbols])
+                        deleted_counts['klines_excess'] = conn.total_changes - changes_before
+                    
+                    # 清理旧的AI选币数据
+                    deleted_counts['ai_coins'] = conn.execute(
+                        "DELETE FROM ai_coins WHERE updated_at < ?", (cutoff_time,)).rowcount
+                    
+                    # 清理旧的持仓量排行数据
+                    deleted_counts['oi_rankings'] = conn.execute(
+                        "DELETE FROM oi_rankings WHERE updated_at < ?", (cutoff_time,)).rowcount
                 
                 # 清理旧的异动数据
-                cursor = conn.execute("DELETE FROM anomalies WHERE created_at < ?", (cutoff_time,))
-                deleted_counts['anomalies'] = cursor.rowcount
-                
-                # 清理旧的AI选币数据
-                cursor = conn.execute("DELETE FROM ai_coins WHERE updated_at < ?", (cutoff_time,))
-                deleted_counts['ai_coins'] = cursor.rowcount
-                
-                # 清理旧的持仓量排行数据
-                cursor = conn.execute("DELETE FROM oi_rankings WHERE updated_at < ?", (cutoff_time,))
-                deleted_counts['oi_rankings'] = cursor.rowcount
-                
-                conn.commit()
+                deleted_counts['anomalies'] = self._delete_in_batches(conn, "anomalies", "created_at", cutoff_time)
                 
                 # 记录清理情况
                 total_deleted = sum(deleted_counts.values())
@@ -236,11 +466,19 @@ class Database:
                     cleanup_msg += f", 持仓量排行={deleted_counts.get('oi_rankings', 0)}"
                     logging.info(cleanup_msg)
                 
-                # 执行VACUUM来释放磁盘空间
-                if total_deleted > 100:  # 只有删除较多数据时才VACUUM
-                    conn.execute("VACUUM")
+                # 按页增量回收空闲页，耗时只与释放的页数有关，而不是整库大小
+                if total_deleted > 100:  # 只有删除较多数据时才回收
+                    pages = self._incremental_vacuum(conn)
                     if LOGGING_CONFIG.get("cleanup_log", True):
-                        logging.info("执行VACUUM优化数据库")
+                        logging.info(f"增量VACUUM回收 {pages} 页")
+                
+                # 大批删除后行数分布变化较大，刷新统计信息让规划器继续选对索引
+                if total_deleted > 0:
+                    self._optimize(conn)
+                
+                # 清理产生的 WAL 帧全部回写后截断 WAL 文件，避免它停留在清理时的峰值大小
+                if total_deleted > 0:
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
                 
                 return deleted_counts
                 
@@ -250,21 +488,36 @@ class Database:
             finally:
                 conn.close()
     
-    def maybe_cleanup(self):
-        """根据时间间隔决定是否需要清理数据"""
+    def maybe_cleanup(self, rows_written: int = 1):
+        """根据时间间隔决定是否需要清理数据
+
+        每次写入后调用。到达清理间隔时直接清理；否则只累加写入行数，
+        每写入 cleanup_check_rows 行才检查一次文件大小和单合约K线数量
+        （后者需要扫描整个 klines 表）。同时按 sqlite_optimize_interval 定期执行 PRAGMA optimize。
+        """
+        if 0 < self.optimize_interval <= time.monotonic() - self._last_optimize_time:
+            self.optimize()
+        
         if not self.auto_cleanup:
             return
             
         current_time = int(time.time())
-        need_cleanup = False
         
         # 检查时间间隔
         if current_time - self.last_cleanup_time >= self.cleanup_interval:
-            need_cleanup = True
+            self.cleanup_old_data()
+            self.last_cleanup_time = current_time
+            self._rows_since_check = 0
+            return
+        
+        self._rows_since_check += rows_written
+        if self._rows_since_check < self.cleanup_check_rows:
+            return
+        self._rows_since_check = 0
+        need_cleanup = False
         
         # 检查数据库大小限制
         if self.max_db_size_mb > 0:
-            import os
             if os.path.exists(self.db_path):
                 file_size_mb = os.path.getsize(self.db_path) / (1024 * 1024)
                 if file_size_mb > self.max_db_size_mb:
@@ -297,33 +550,22 @@ class Database:
     
     def get_data_size_info(self) -> Dict:
         """获取数据库大小和记录数信息"""
-        import os
-        
         conn = self.get_connection()
         try:
             # 获取文件大小
             file_size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
             file_size_mb = file_size / (1024 * 1024)
             
-            # 获取各表记录数
-            cursor = conn.execute("SELECT COUNT(*) as count FROM klines")
-            klines_count = cursor.fetchone()['count']
-            
-            cursor = conn.execute("SELECT COUNT(*) as count FROM anomalies")
-            anomalies_count = cursor.fetchone()['count']
-            
-            cursor = conn.execute("SELECT COUNT(*) as count FROM ai_coins")
-            ai_coins_count = cursor.fetchone()['count']
-            
-            cursor = conn.execute("SELECT COUNT(*) as count FROM oi_rankings")
-            oi_rankings_count = cursor.fetchone()['count']
-            
-            # 获取最旧数据的时间
-            cursor = conn.execute("SELECT MIN(created_at) as oldest FROM klines")
-            oldest_kline = cursor.fetchone()['oldest']
-            
-            cursor = conn.execute("SELECT MIN(created_at) as oldest FROM anomalies")
-            oldest_anomaly = cursor.fetchone()['oldest']
+            # 各表记录数和最旧数据时间合并为一条语句，一次往返取回
+            (klines_count, anomalies_count, ai_coins_count, oi_rankings_count,
+             oldest_kline, oldest_anomaly) = conn.execute("""
+                SELECT (SELECT COUNT(*) FROM klines),
+                       (SELECT COUNT(*) FROM anomalies),
+                       (SELECT COUNT(*) FROM ai_coins),
+                       (SELECT COUNT(*) FROM oi_rankings),
+                       (SELECT MIN(created_at) FROM klines),
+                       (SELECT MIN(created_at) FROM anomalies)
+            """).fetchone()
             
             return {
                 "file_size_mb": round(file_size_mb, 2),
@@ -342,106 +584,317 @@ class Database:
         finally:
             conn.close()
     
+    _INSERT_KLINE_SQL = """
+        INSERT INTO klines 
+        (symbol, open_time, close_time, open_price, high_price, low_price, 
+         close_price, volume, quote_volume, trades_count, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(symbol, open_time) DO UPDATE SET
+            close_time = excluded.close_time,
+            open_price = excluded.open_price,
+            high_price = excluded.high_price,
+            low_price = excluded.low_price,
+            close_price = excluded.close_price,
+            volume = excluded.volume,
+            quote_volume = excluded.quote_volume,
+            trades_count = excluded.trades_count,
+            created_at = excluded.created_at
+    """
+    
+    @staticmethod
+    def _kline_row(symbol: str, kline_data: Dict, created_at: int) -> tuple:
+        """K线 dict -> klines 表的一行参数"""
+        return (
+            symbol,
+            kline_data['open_time'],
+            kline_data['close_time'],
+            kline_data['open_price'],
+            kline_data['high_price'],
+            kline_data['low_price'],
+            kline_data['close_price'],
+            kline_data['volume'],
+            kline_data['quote_volume'],
+            kline_data.get('trades_count', 0),
+            created_at
+        )
+    
     def insert_kline(self, symbol: str, kline_data: Dict):
         """插入K线数据"""
+        self.insert_klines_bulk([(symbol, kline_data)])
+    
+    def insert_klines_bulk(self, klines: Iterable[Tuple[str, Dict]]):
+        """批量插入K线数据（单个事务，一次提交）
+
+        klines: (symbol, kline_data) 序列
+        """
+        created_at = int(time.time())
+        rows = [self._kline_row(symbol, kline_data, created_at) for symbol, kline_data in klines]
+        if not rows:
+            return
         with self.lock:
             conn = self.get_connection()
             try:
-                conn.execute("""
-                    INSERT OR REPLACE INTO klines 
-                    (symbol, open_time, close_time, open_price, high_price, low_price, 
-                     close_price, volume, quote_volume, trades_count, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    symbol,
-                    kline_data['open_time'],
-                    kline_data['close_time'],
-                    kline_data['open_price'],
-                    kline_data['high_price'],
-                    kline_data['low_price'],
-                    kline_data['close_price'],
-                    kline_data['volume'],
-                    kline_data['quote_volume'],
-                    kline_data.get('trades_count', 0),
-                    int(time.time())
-                ))
-                conn.commit()
+                with conn:  # 成功提交，异常回滚
+                    conn.executemany(self._INSERT_KLINE_SQL, rows)
             finally:
                 conn.close()
         
-        # 检查是否需要清理旧数据
-        self.maybe_cleanup()
+        # 检查是否需要清理旧数据（每批只检查一次）
+        self.maybe_cleanup(len(rows))
+    
+    @staticmethod
+    def _fetch_dicts(cursor) -> List[Dict]:
+        """把查询结果转成 dict 列表（列名只取一次，比逐行 dict(sqlite3.Row) 快）"""
+        columns = tuple(d[0] for d in cursor.description)
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    
+    # K线读取返回的列（不含内部自增 id）
+    _KLINE_SELECT = ("symbol, open_time, close_time, open_price, high_price, low_price, close_price, "
+                     "volume, quote_volume, trades_count, created_at")
     
     def get_recent_klines(self, symbol: str, limit: int = 150) -> List[Dict]:
         """获取最近的K线数据"""
         conn = self.get_connection()
         try:
-            cursor = conn.execute("""
-                SELECT * FROM klines 
+            cursor = conn.execute(f"""
+                SELECT {self._KLINE_SELECT} FROM klines 
                 WHERE symbol = ? 
                 ORDER BY open_time DESC 
                 LIMIT ?
             """, (symbol, limit))
             
+            return self._fetch_dicts(cursor)[::-1]  # 按时间正序返回
+        finally:
+            conn.close()
+    
+    # get_recent_klines_np 返回的结构化数组字段（与 klines 表列名一致）
+    KLINE_NP_DTYPE = np.dtype([
+        ('open_time', np.int64),
+        ('open_price', np.float64),
+        ('high_price', np.float64),
+        ('low_price', np.float64),
+        ('close_price', np.float64),
+        ('volume', np.float64),
+        ('quote_volume', np.float64),
+    ])
+    
+    def get_recent_klines_np(self, symbol: str, limit: int = 150) -> np.ndarray:
+        """获取最近的K线数据（NumPy 结构化数组，按时间正序）
+
+        与 get_recent_klines 内容相同，但整批数据放在一块连续内存中，按列取用
+        （如 arr['close_price']），不为每行创建 dict。
+        """
+        conn = self.get_connection()
+        conn.row_factory = None
+        try:
+            rows = conn.execute("""
+                SELECT open_time, open_price, high_price, low_price, close_price, volume, quote_volume
+                FROM klines
+                WHERE symbol = ?
+                ORDER BY open_time DESC
+                LIMIT ?
+            """, (symbol, limit)).fetchall()
+        finally:
+            conn.close()
+        return np.array(rows, dtype=self.KLINE_NP_DTYPE)[::-1]
+    
+    def get_recent_klines_bulk(self, symbols: Iterable[str], limit_per_symbol: int = 16) -> Dict[str, List[Dict]]:
+        """一次查询获取多个合约最近的K线数据
+
+        返回 {symbol: [kline dict, ...]}（按时间正序，格式与 get_recent_klines 相同），
+        没有K线的合约不出现在结果中。
+        """
+        symbol_clause, symbol_params = self._symbol_in_clause(symbols)
+        if not symbol_params:
+            return {}
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(f"""
+                SELECT * FROM (
+                    SELECT {self._KLINE_SELECT},
+                           ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY open_time DESC) AS rn
+                    FROM klines
+                    WHERE 1=1 {symbol_clause}
+                )
+                WHERE rn <= ?
+                ORDER BY symbol, open_time
+            """, (*symbol_params, limit_per_symbol))
+            columns = tuple(d[0] for d in cursor.description)[:-1]  # 去掉最后的 rn 列
             rows = cursor.fetchall()
-            return [dict(row) for row in reversed(rows)]  # 按时间正序返回
         finally:
             conn.close()
+
+        return {
+            symbol: [dict(zip(columns, row)) for row in group]
+            for symbol, group in groupby(rows, key=itemgetter('symbol'))
+        }
+
+    def get_all_recent_klines(self, limit_per_symbol: int = 150) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """一次查询获取所有合约最近的K线数据（按时间正序）
+
+        返回 {symbol: (open_times, matrix, latest)}：open_times 为 int64 一维数组，matrix 为 (n, 4) 的
+        float32 数组（历史统计精度足够，内存占用减半），列依次为 close/high/low/quote_volume；
+        latest 为最后两根K线同样列的 float64 副本，当前收益率和写入数据库的收盘价/成交额由它计算，不损失精度。
+        """
+        conn = self.get_connection()
+        conn.row_factory = None
+        try:
+            rows = conn.execute("""
+                SELECT symbol, open_time, close_price, high_price, low_price, quote_volume FROM (
+                    SELECT symbol, open_time, close_price, high_price, low_price, quote_volume,
+                           ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY open_time DESC) AS rn
+                    FROM klines
+                )
+                WHERE rn <= ?
+                ORDER BY symbol, open_time
+            """, (limit_per_symbol,)).fetchall()
+        finally:
+            conn.close()
+        
+        if not rows:
+            return {}
+        
+        symbols = np.array([r[0] for r in rows])
+        data = np.array([r[1:] for r in rows], dtype=np.float64)
+        unique_symbols, starts = np.unique(symbols, return_index=True)
+        result = {}
+        for symbol, chunk in zip(unique_symbols.tolist(), np.split(data, starts[1:])):
+            result[symbol] = (chunk[:, 0].astype(np.int64), np.ascontiguousarray(chunk[:, 1:], dtype=np.float32),
+                              chunk[-2:, 1:].copy())
+        return result
+    
+    _INSERT_ANOMALY_SQL = """
+        INSERT INTO anomalies 
+        (symbol, timestamp, interval_type, cur_return, cur_abs_return, close_price,
+         cur_volume, cur_volatility, price_zscore, price_percentile, volume_zscore,
+         volatility_zscore, anomaly_score, price_score, volume_score, volatility_score,
+         anomaly_reasons, quote_volume_24h, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(symbol, timestamp, interval_type) DO UPDATE SET
+            cur_return = excluded.cur_return,
+            cur_abs_return = excluded.cur_abs_return,
+            close_price = excluded.close_price,
+            cur_volume = excluded.cur_volume,
+            cur_volatility = excluded.cur_volatility,
+            price_zscore = excluded.price_zscore,
+            price_percentile = excluded.price_percentile,
+            volume_zscore = excluded.volume_zscore,
+            volatility_zscore = excluded.volatility_zscore,
+            anomaly_score = excluded.anomaly_score,
+            price_score = excluded.price_score,
+            volume_score = excluded.volume_score,
+            volatility_score = excluded.volatility_score,
+            anomaly_reasons = excluded.anomaly_reasons,
+            quote_volume_24h = excluded.quote_volume_24h,
+            created_at = excluded.created_at
+    """
+    
+    @staticmethod
+    def _anomaly_row(anomaly_data, created_at: int) -> tuple:
+        """异动结果 AnomalyRow 或 dict -> anomalies 表的一行参数"""
+        if isinstance(anomaly_data, AnomalyRow):
+            return (*anomaly_data[:-1], created_at)
+        return (
+            anomaly_data['symbol'],
+            anomaly_data['timestamp'],
+            anomaly_data['interval_type'],
+            anomaly_data['cur_return'],
+            anomaly_data['cur_abs_return'],
+            anomaly_data['close_price'],
+            anomaly_data['cur_volume'],
+            anomaly_data['cur_volatility'],
+            anomaly_data['price_zscore'],
+            anomaly_data['price_percentile'],
+            anomaly_data['volume_zscore'],
+            anomaly_data['volatility_zscore'],
+            anomaly_data['anomaly_score'],
+            anomaly_data['price_score'],
+            anomaly_data['volume_score'],
+            anomaly_data['volatility_score'],
+            anomaly_data['anomaly_reasons'],
+            anomaly_data['quote_volume_24h'],
+            created_at
+        )
     
     def insert_anomaly(self, anomaly_data: Dict):
         """插入异动数据"""
+        self.insert_anomalies_many([anomaly_data])
+    
+    def insert_anomalies_many(self, anomalies: List[Dict]):
+        """批量插入异动数据（单个事务，一次提交）
+
+        任一行失败时整个事务回滚并抛出异常，由调用方决定是否逐条重试。
+        """
+        if not anomalies:
+            return
+        created_at = int(time.time())
+        rows = [self._anomaly_row(a, created_at) for a in anomalies]
         with self.lock:
             conn = self.get_connection()
             try:
-                conn.execute("""
-                    INSERT OR REPLACE INTO anomalies 
-                    (symbol, timestamp, interval_type, cur_return, cur_abs_return, close_price,
-                     cur_volume, cur_volatility, price_zscore, price_percentile, volume_zscore,
-                     volatility_zscore, anomaly_score, price_score, volume_score, volatility_score,
-                     anomaly_reasons, quote_volume_24h, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    anomaly_data['symbol'],
-                    anomaly_data['timestamp'],
-                    anomaly_data['interval_type'],
-                    anomaly_data['cur_return'],
-                    anomaly_data['cur_abs_return'],
-                    anomaly_data['close_price'],
-                    anomaly_data['cur_volume'],
-                    anomaly_data['cur_volatility'],
-                    anomaly_data['price_zscore'],
-                    anomaly_data['price_percentile'],
-                    anomaly_data['volume_zscore'],
-                    anomaly_data['volatility_zscore'],
-                    anomaly_data['anomaly_score'],
-                    anomaly_data['price_score'],
-                    anomaly_data['volume_score'],
-                    anomaly_data['volatility_score'],
-                    anomaly_data['anomaly_reasons'],
-                    anomaly_data['quote_volume_24h'],
-                    int(time.time())
-                ))
-                conn.commit()
+                with conn:  # 成功提交，异常回滚
+                    conn.executemany(self._INSERT_ANOMALY_SQL, rows)
             finally:
                 conn.close()
         
-        # 检查是否需要清理旧数据
-        self.maybe_cleanup()
+        # 检查是否需要清理旧数据（每批只检查一次）
+        self.maybe_cleanup(len(rows))
     
-    def get_recent_anomalies(self, interval_type: str = "15m", hours: int = 24, limit: int = 100) -> List[Dict]:
-        """获取最近的异动数据"""
+    @staticmethod
+    def _symbol_in_clause(symbol_filter: Optional[Iterable[str]]) -> Tuple[str, list]:
+        """构造 `AND symbol IN (?,?,...)` 子句及其参数
+
+        symbol_filter 为 None 时不过滤，返回空子句。
+        """
+        if symbol_filter is None:
+            return "", []
+        symbols = list(symbol_filter)
+        return f"AND symbol IN ({','.join('?' * len(symbols))})", symbols
+
+    # get_recent_anomalies 的 columns 参数允许的列名
+    _ANOMALY_COLUMNS = frozenset((
+        'id', 'symbol', 'timestamp', 'interval_type', 'cur_return', 'cur_abs_return', 'close_price',
+        'cur_volume', 'cur_volatility', 'price_zscore', 'price_percentile', 'volume_zscore',
+        'volatility_zscore', 'anomaly_score', 'price_score', 'volume_score', 'volatility_score',
+        'anomaly_reasons', 'quote_volume_24h', 'created_at',
+    ))
+    # 未指定 columns 时读取的列（除内部自增 id 外的全部列）
+    _ANOMALY_SELECT = ("symbol, timestamp, interval_type, cur_return, cur_abs_return, close_price, "
+                       "cur_volume, cur_volatility, price_zscore, price_percentile, volume_zscore, "
+                       "volatility_zscore, anomaly_score, price_score, volume_score, volatility_score, "
+                       "anomaly_reasons, quote_volume_24h, created_at")
+    
+    def get_recent_anomalies(self, interval_type: str = "15m", hours: int = 24, limit: int = 100,
+                             symbol_filter: Optional[Iterable[str]] = None,
+                             columns: Optional[Iterable[str]] = None) -> List[Dict]:
+        """获取最近的异动数据
+
+        symbol_filter: 可选的交易对集合，仅返回其中的交易对（在SQL中过滤）
+        columns: 可选的列名列表，只读取并返回这些列（默认除 id 外的全部列）
+        """
         since_timestamp = int(time.time()) - (hours * 3600)
+        symbol_clause, symbol_params = self._symbol_in_clause(symbol_filter)
+        if symbol_filter is not None and not symbol_params:
+            return []
+        if columns is None:
+            select_list = self._ANOMALY_SELECT
+        else:
+            columns = list(columns)
+            unknown = set(columns) - self._ANOMALY_COLUMNS
+            if unknown:
+                raise ValueError(f"未知的异动列: {sorted(unknown)}")
+            select_list = ", ".join(columns)
         
         conn = self.get_connection()
         try:
-            cursor = conn.execute("""
-                SELECT * FROM anomalies 
-                WHERE interval_type = ? AND timestamp >= ?
+            cursor = conn.execute(f"""
+                SELECT {select_list} FROM anomalies 
+                WHERE interval_type = ? AND timestamp >= ? {symbol_clause}
                 ORDER BY anomaly_score DESC, timestamp DESC
                 LIMIT ?
-            """, (interval_type, since_timestamp, limit))
+            """, (interval_type, since_timestamp, *symbol_params, limit))
             
-            return [dict(row) for row in cursor.fetchall()]
+            return self._fetch_dicts(cursor)
         finally:
             conn.close()
     
@@ -475,23 +928,17 @@ class Database:
 
     def get_symbol_stats(self) -> Dict:
         """获取数据库统计信息"""
-        import os
-        
         conn = self.get_connection()
         try:
             # 获取文件大小
             file_size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
             file_size_mb = file_size / (1024 * 1024)
             
-            cursor = conn.execute("SELECT COUNT(DISTINCT symbol) as symbol_count FROM klines")
-            symbol_count = cursor.fetchone()['symbol_count']
-            
-            cursor = conn.execute("SELECT COUNT(*) as kline_count FROM klines")
-            kline_count = cursor.fetchone()['kline_count']
-            
-            cursor = conn.execute("SELECT COUNT(*) as anomaly_count FROM anomalies WHERE timestamp >= ?", 
-                                (int(time.time()) - 86400,))  # 最近24小时
-            anomaly_count = cursor.fetchone()['anomaly_count']
+            symbol_count, kline_count, anomaly_count = conn.execute("""
+                SELECT (SELECT COUNT(DISTINCT symbol) FROM klines),
+                       (SELECT COUNT(*) FROM klines),
+                       (SELECT COUNT(*) FROM anomalies WHERE timestamp >= ?)
+            """, (int(time.time()) - 86400,)).fetchone()  # 异动只统计最近24小时
             
             return {
                 "symbol_count": symbol_count,
@@ -505,42 +952,95 @@ class Database:
     
     # ===== AI选币数据表操作 =====
     
+    _UPSERT_AI_COIN_SQL = """
+        INSERT INTO ai_coins
+        (symbol, score, start_time, start_price, current_price, max_price,
+         increase_percent, volume_24h, price_change_24h, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(symbol) DO UPDATE SET
+            score = excluded.score,
+            start_time = excluded.start_time,
+            start_price = excluded.start_price,
+            current_price = excluded.current_price,
+            max_price = excluded.max_price,
+            increase_percent = excluded.increase_percent,
+            volume_24h = excluded.volume_24h,
+            price_change_24h = excluded.price_change_24h,
+            updated_at = excluded.updated_at
+    """
+    
+    @staticmethod
+    def _ai_coin_row(coin_data, updated_at: int) -> tuple:
+        """AI选币 CoinScore 或 dict -> ai_coins 表的一行参数"""
+        if isinstance(coin_data, CoinScore):
+            return (*coin_data, updated_at)
+        return (
+            coin_data['symbol'],
+            coin_data['score'],
+            coin_data['start_time'],
+            coin_data['start_price'],
+            coin_data['current_price'],
+            coin_data['max_price'],
+            coin_data['increase_percent'],
+            coin_data['volume_24h'],
+            coin_data['price_change_24h'],
+            updated_at
+        )
+    
     def upsert_ai_coin(self, coin_data: Dict):
         """插入或更新AI选币数据"""
+        self.upsert_ai_coins_bulk([coin_data])
+    
+    def upsert_ai_coins_bulk(self, coins: List):
+        """批量插入或更新AI选币数据（单个事务，一次提交，整批共用一个 updated_at）"""
+        if not coins:
+            return
+        updated_at = int(time.time())
+        rows = [self._ai_coin_row(coin, updated_at) for coin in coins]
         with self.lock:
             conn = self.get_connection()
             try:
-                conn.execute("""
-                    INSERT OR REPLACE INTO ai_coins
-                    (symbol, score, start_time, start_price, current_price, max_price,
-                     increase_percent, volume_24h, price_change_24h, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    coin_data['symbol'],
-                    coin_data['score'],
-                    coin_data['start_time'],
-                    coin_data['start_price'],
-                    coin_data['current_price'],
-                    coin_data['max_price'],
-                    coin_data['increase_percent'],
-                    coin_data['volume_24h'],
-                    coin_data['price_change_24h'],
-                    int(time.time())
-                ))
-                conn.commit()
+                with conn:  # 成功提交，异常回滚
+                    conn.executemany(self._UPSERT_AI_COIN_SQL, rows)
             finally:
                 conn.close()
     
-    def get_ai_coins(self, limit: int = 20) -> List[Dict]:
-        """获取AI选币排行数据"""
+    def replace_ai_coins(self, coins: List):
+        """用一组数据整体替换 ai_coins 表（DELETE + 批量INSERT 在同一事务内）
+
+        读取方只会看到替换前或替换后的完整数据，不会读到中间的空表。
+        """
+        updated_at = int(time.time())
+        rows = [self._ai_coin_row(coin, updated_at) for coin in coins]
+        with self.lock:
+            conn = self.get_connection()
+            try:
+                with conn:  # 成功提交，异常回滚
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("DELETE FROM ai_coins")
+                    conn.executemany(self._UPSERT_AI_COIN_SQL, rows)
+            finally:
+                conn.close()
+    
+    def get_ai_coins(self, limit: int = 20, symbol_filter: Optional[Iterable[str]] = None) -> List[Dict]:
+        """获取AI选币排行数据
+
+        symbol_filter: 可选的交易对集合，仅返回其中的交易对（在SQL中过滤）
+        """
+        symbol_clause, symbol_params = self._symbol_in_clause(symbol_filter)
+        if symbol_filter is not None and not symbol_params:
+            return []
         conn = self.get_connection()
         try:
-            cursor = conn.execute("""
-                SELECT * FROM ai_coins
+            cursor = conn.execute(f"""
+                SELECT symbol, score, start_time, start_price, current_price, max_price,
+                       increase_percent, volume_24h, price_change_24h, updated_at
+                FROM ai_coins
+                WHERE 1=1 {symbol_clause}
                 ORDER BY score DESC, volume_24h DESC
                 LIMIT ?
-            """, (limit,))
-            return [dict(row) for row in cursor.fetchall()]
+            """, (*symbol_params, limit))
+            return self._fetch_dicts(cursor)
         finally:
             conn.close()
     
@@ -556,43 +1056,92 @@ class Database:
     
     # ===== 持仓量排行数据表操作 =====
     
+    _UPSERT_OI_RANKING_SQL = """
+        INSERT INTO oi_rankings
+        (symbol, rank, current_oi, oi_delta, oi_delta_percent, oi_delta_value,
+         price_delta_percent, net_long, net_short, volume_24h, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(symbol) DO UPDATE SET
+            rank = excluded.rank,
+            current_oi = excluded.current_oi,
+            oi_delta = excluded.oi_delta,
+            oi_delta_percent = excluded.oi_delta_percent,
+            oi_delta_value = excluded.oi_delta_value,
+            price_delta_percent = excluded.price_delta_percent,
+            net_long = excluded.net_long,
+            net_short = excluded.net_short,
+            volume_24h = excluded.volume_24h,
+            updated_at = excluded.updated_at
+    """
+    
+    @staticmethod
+    def _oi_ranking_row(oi_data: Dict, updated_at: int) -> tuple:
+        """持仓量排行 dict -> oi_rankings 表的一行参数"""
+        return (
+            oi_data['symbol'],
+            oi_data['rank'],
+            oi_data['current_oi'],
+            oi_data['oi_delta'],
+            oi_data['oi_delta_percent'],
+            oi_data['oi_delta_value'],
+            oi_data['price_delta_percent'],
+            oi_data['net_long'],
+            oi_data['net_short'],
+            oi_data['volume_24h'],
+            updated_at
+        )
+    
     def upsert_oi_ranking(self, oi_data: Dict):
         """插入或更新持仓量排行数据"""
+        self.upsert_oi_rankings_bulk([oi_data])
+    
+    def upsert_oi_rankings_bulk(self, oi_list: List[Dict]):
+        """批量插入或更新持仓量排行数据（单个事务，一次提交，整批共用一个 updated_at）"""
+        if not oi_list:
+            return
+        updated_at = int(time.time())
+        rows = [self._oi_ranking_row(oi, updated_at) for oi in oi_list]
         with self.lock:
             conn = self.get_connection()
             try:
-                conn.execute("""
-                    INSERT OR REPLACE INTO oi_rankings
-                    (symbol, rank, current_oi, oi_delta, oi_delta_percent, oi_delta_value,
-                     price_delta_percent, net_long, net_short, volume_24h, updated_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    oi_data['symbol'],
-                    oi_data['rank'],
-                    oi_data['current_oi'],
-                    oi_data['oi_delta'],
-                    oi_data['oi_delta_percent'],
-                    oi_data['oi_delta_value'],
-                    oi_data['price_delta_percent'],
-                    oi_data['net_long'],
-                    oi_data['net_short'],
-                    oi_data['volume_24h'],
-                    int(time.time())
-                ))
-                conn.commit()
+                with conn:  # 成功提交，异常回滚
+                    conn.executemany(self._UPSERT_OI_RANKING_SQL, rows)
+            finally:
+                conn.close()
+    
+    def replace_oi_rankings(self, oi_list: List[Dict]):
+        """用一组数据整体替换 oi_rankings 表（DELETE + 批量INSERT 在同一事务内）"""
+        updated_at = int(time.time())
+        rows = [self._oi_ranking_row(oi, updated_at) for oi in oi_list]
+        with self.lock:
+            conn = self.get_connection()
+            try:
+                with conn:  # 成功提交，异常回滚
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("DELETE FROM oi_rankings")
+                    conn.executemany(self._UPSERT_OI_RANKING_SQL, rows)
             finally:
                 conn.close()
     
-    def get_oi_rankings(self, limit: int = 20) -> List[Dict]:
-        """获取持仓量排行数据"""
+    def get_oi_rankings(self, limit: int = 20, symbol_filter: Optional[Iterable[str]] = None) -> List[Dict]:
+        """获取持仓量排行数据
+
+        symbol_filter: 可选的交易对集合，仅返回其中的交易对（在SQL中过滤）
+        """
+        symbol_clause, symbol_params = self._symbol_in_clause(symbol_filter)
+        if symbol_filter is not None and not symbol_params:
+            return []
         conn = self.get_connection()
         try:
-            cursor = conn.execute("""
-                SELECT * FROM oi_rankings
+            cursor = conn.execute(f"""
+                SELECT symbol, rank, current_oi, oi_delta, oi_delta_percent, oi_delta_value,
+                       price_delta_percent, net_long, net_short, volume_24h, updated_at
+                FROM oi_rankings
+                WHERE 1=1 {symbol_clause}
                 ORDER BY rank ASC
                 LIMIT ?
-            """, (limit,))
-            return [dict(row) for row in cursor.fetchall()]
+            """, (*symbol_params, limit))
+            return self._fetch_dicts(cursor)
         finally:
             conn.close()
     
@@ -627,8 +1176,7 @@ class Database:
                     quote = s.get('quoteAsset') or s.get('quote') or None
                     raw = None
                     try:
-                        import json as _json
-                        raw = _json.dumps(s, ensure_ascii=False)
+                        raw = json.dumps(s, ensure_ascii=False)
                     except Exception:
                         raw = None
                     data.append((symbol, status, base, quote, raw, now))
@@ -646,7 +1194,6 @@ class Database:
             cursor = conn.execute("SELECT symbol, status, baseAsset, quoteAsset, raw_json, updated_at FROM aster ORDER BY symbol")
             rows = cursor.fetchall()
             result = []
-            import json as _json
             for r in rows:
                 item = {
                     'symbol': r['symbol'],
@@ -658,7 +1205,7 @@ class Database:
                 raw = r['raw_json']
                 if raw:
                     try:
-                        item['raw'] = _json.loads(raw)
+                        item['raw'] = json.loads(raw)
                     except Exception:
                         item['raw'] = raw
                 result.append(item)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+json_utils.py - JSON 编解码
+
+优先使用 orjson（C实现，解析大体积响应更快），未安装时回退到标准库 json。
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """解析 JSON，接受 str / bytes（如 requests 的 response.content）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, default=None, sort_keys: bool = False, indent: bool = False) -> str:
+    """序列化为紧凑的 JSON 字符串（UTF-8，不转义中文）
+
+    default: 无法序列化对象时的回调；indent=True 时缩进2格便于阅读
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option).decode()
+    if indent:
+        return json.dumps(obj, default=default, sort_keys=sort_keys, ensure_ascii=False, indent=2)
+    return json.dumps(obj, default=default, sort_keys=sort_keys, ensure_ascii=False, separators=(",", ":"))
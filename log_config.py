@@ -4,18 +4,73 @@ log_config.py - 统一日志配置
 
 将日志输出到控制台和文件（带滚动），供各模块调用 setup_logging()。
 """
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import time
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener, MemoryHandler
 
 LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')
 LOG_FILE = os.path.join(LOG_DIR, 'heyue.log')
 
+# 文件日志缓冲：攒够条数、遇到 ERROR 或距上次写盘超过间隔时才批量写入
+LOG_BUFFER_CAPACITY = 1024
+LOG_FLUSH_INTERVAL = 5  # 秒
+
+
+class _SizeTrackingRotatingFileHandler(RotatingFileHandler):
+    """自行累计已写入字节数的 RotatingFileHandler
+
+    标准实现每条日志都要 seek 到文件末尾再 tell 判断是否滚动；这里按编码后的长度累加，
+    估算值未达到 maxBytes 前不访问文件，达到后才交给标准实现精确判断。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._approx_size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+
+    def shouldRollover(self, record):
+        if self.maxBytes <= 0:
+            return False
+        self._approx_size += len(self.format(record).encode(self.encoding or 'utf-8', 'replace')) + 1
+        if self._approx_size < self.maxBytes:
+            return False
+        if super().shouldRollover(record):
+            return True
+        # 估算偏大（例如文件被外部截断），以实际大小重新计数
+        self._approx_size = os.path.getsize(self.baseFilename) if os.path.exists(self.baseFilename) else 0
+        return False
+
+    def doRollover(self):
+        super().doRollover()
+        self._approx_size = 0
+
+
+class _BufferedFileHandler(MemoryHandler):
+    """带时间上限的 MemoryHandler：除容量和级别外，距上次写盘超过 flush_interval 秒也会写盘，
+    避免日志量小时文件内容长时间滞后"""
+
+    def __init__(self, target, capacity: int, flush_interval: float, flushLevel=logging.ERROR):
+        super().__init__(capacity, flushLevel=flushLevel, target=target, flushOnClose=True)
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def shouldFlush(self, record):
+        return (super().shouldFlush(record)
+                or time.monotonic() - self._last_flush >= self.flush_interval)
+
+    def flush(self):
+        super().flush()
+        self._last_flush = time.monotonic()
+
 
 def setup_logging(level: int = logging.INFO):
     """配置根日志记录器：
     - 控制台 (StreamHandler)
-    - 文件 (RotatingFileHandler)
+    - 文件 (RotatingFileHandler，经内存缓冲批量写入)
+    两个处理器由后台 QueueListener 线程驱动，业务线程记录日志时只入队，
+    不做格式化和文件I/O。
     如果已经配置过处理器，则不会重复添加（幂等）。
     """
     os.makedirs(LOG_DIR, exist_ok=True)
@@ -31,18 +86,35 @@ def setup_logging(level: int = logging.INFO):
         "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
+    # 文件使用紧凑格式：两位年份、级别只取首字母，每行前缀约短三分之一，
+    # 同样 5MB 的滚动上限能保留更长时间的日志
+    file_fmt = logging.Formatter(
+        "%(asctime)s %(levelname).1s %(name)s: %(message)s",
+        datefmt="%y%m%d %H:%M:%S",
+    )
 
     # 控制台输出
     sh = logging.StreamHandler()
     sh.setLevel(level)
     sh.setFormatter(fmt)
-    logger.addHandler(sh)
 
     # 日志文件（滚动）
-    fh = RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8')
+    fh = _SizeTrackingRotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8')
     fh.setLevel(level)
-    fh.setFormatter(fmt)
-    logger.addHandler(fh)
+    fh.setFormatter(file_fmt)
+
+    # 文件写入经内存缓冲批量落盘，ERROR 及以上立即写入
+    bfh = _BufferedFileHandler(fh, LOG_BUFFER_CAPACITY, LOG_FLUSH_INTERVAL)
+    bfh.setLevel(level)
+
+    # 根日志器只挂 QueueHandler，实际输出在监听线程中完成；
+    # 退出时先排空队列（atexit 后注册先执行），再把缓冲写入文件
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, sh, bfh, respect_handler_level=True)
+    listener.start()
+    atexit.register(bfh.flush)
+    atexit.register(listener.stop)
 
 
 if __name__ == '__main__':
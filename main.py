@@ -5,6 +5,7 @@ main.py - 主启动脚本
 集成启动WebSocket数据收集器、异动检测器和API服务器
 """
 
+import importlib.metadata
 import time
 import signal
 import sys
@@ -15,16 +16,27 @@ from ws_collector import start_collector_background
 from anomaly_detector import start_detector_background
 from data_updater import start_updater_background, download_and_store_aster
 from api_server import app
+from database import db
 from log_config import setup_logging
 import logging
 
+try:
+    from config import API_CONFIG
+except ImportError:
+    API_CONFIG = {"host": "0.0.0.0", "port": 5000, "embedded": True}
+
+try:
+    import waitress
+except ImportError:  # waitress 为可选依赖，未安装时回退到 Flask 开发服务器
+    waitress = None
+
 # 初始化日志
 setup_logging()
 logger = logging.getLogger(__name__)
 
 class SystemManager:
     def __init__(self):
-        self.running = True
+        self._stop_event = threading.Event()
         self.collector = None
         self.detector = None
         self.updater = None
@@ -41,10 +53,27 @@ class SystemManager:
         sys.exit(0)
     
     def start_api_server(self):
-        """启动API服务器"""
+        """启动API服务器
+
+        API_CONFIG["embedded"] 为 False 时不在进程内启动，由 gunicorn 单独运行 wsgi:application；
+        已安装 waitress 时用它的线程池服务器，否则用 Flask 开发服务器
+        """
+        if not API_CONFIG.get("embedded", True):
+            logger.info("API服务器未内嵌启动，请使用 gunicorn 运行 wsgi:application")
+            return
+
         def run_api():
             try:
-                app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+                if waitress is not None:
+                    logger.info(f"API服务器: waitress {importlib.metadata.version('waitress')}")
+                    waitress.serve(app, host=API_CONFIG["host"], port=API_CONFIG["port"],
+                                   threads=API_CONFIG.get("threads", 8),
+                                   connection_limit=API_CONFIG.get("connection_limit", 200),
+                                   channel_timeout=API_CONFIG.get("channel_timeout", 60))
+                else:
+                    logger.info("API服务器: Flask 开发服务器（安装 waitress 可获得更好的并发性能）")
+                    app.run(host=API_CONFIG["host"], port=API_CONFIG["port"],
+                            debug=False, use_reloader=False, threaded=True)
             except Exception as e:
                 logger.exception(f"API服务器启动失败: {e}")
         
@@ -53,21 +82,22 @@ class SystemManager:
     
     def start(self):
         """启动所有服务"""
-        logger.info("=== 币安合约异动检测系统 ===")
-        logger.info(f"启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # 显示数据库配置信息
-        from database import db
-        logger.info(f"\n数据库配置:")
-        logger.info(f"- 数据保留时间: {db.max_age_hours} 小时")
-        logger.info(f"- 清理检查间隔: {db.cleanup_interval//60} 分钟")
+        # 启动信息和数据库配置合成一条多行日志输出
         stats = db.get_symbol_stats()
-        logger.info(f"- 当前数据库大小: {stats['file_size_mb']} MB")
-        logger.info(f"- 监控合约数量: {stats['symbol_count']}")
-        logger.info(f"- K线数据条数: {stats['kline_count']}")
-        logger.info(f"- 自动清理: {'启用' if db.auto_cleanup else '禁用'}")
-        logger.info(f"- 大小限制: {db.max_db_size_mb} MB")
-        logger.info("")
+        logger.info("\n".join([
+            "=== 币安合约异动检测系统 ===",
+            f"启动时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            "",
+            "数据库配置:",
+            f"- 数据保留时间: {db.max_age_hours} 小时",
+            f"- 清理检查间隔: {db.cleanup_interval//60} 分钟",
+            f"- 当前数据库大小: {stats['file_size_mb']} MB",
+            f"- 监控合约数量: {stats['symbol_count']}",
+            f"- K线数据条数: {stats['kline_count']}",
+            f"- 自动清理: {'启用' if db.auto_cleanup else '禁用'}",
+            f"- 大小限制: {db.max_db_size_mb} MB",
+            "",
+        ]))
         
         try:
             # 启动时先下载并更新 Aster exchangeInfo
@@ -100,43 +130,41 @@ class SystemManager:
             self.start_api_server()
             time.sleep(1)
             
-            logger.info("")
-            logger.info("=== 系统启动完成 ===")
-            logger.info("WebSocket数据收集器: 运行中")
-            logger.info("异动检测器: 运行中")
-            logger.info("数据更新器: 运行中 (每3分钟更新)")
-            logger.info("API服务器: http://localhost:5000")
-            logger.info("")
-            logger.info("🔗 主要API接口:")
-            logger.info("- AI选币决策: http://localhost:5000/api/coins")
-            logger.info("- 持仓量排行: http://localhost:5000/api/oitop")
-            logger.info("- 异动数据: http://localhost:5000/api/anomalies/top")
-            logger.info("- 健康检查: http://localhost:5000/api/health")
-            logger.info("")
-            logger.info("💡 数据更新频率:")
-            logger.info("- K线数据: 实时（WebSocket）")
-            logger.info("- 异动检测: 每1分钟")
-            logger.info("- AI选币排行: 每3分钟")
-            logger.info("- 持仓量排行: 每3分钟")
-            logger.info("")
-            logger.info("按 Ctrl+C 停止系统")
+            logger.info("\n".join([
+                "",
+                "=== 系统启动完成 ===",
+                "WebSocket数据收集器: 运行中",
+                "异动检测器: 运行中",
+                "数据更新器: 运行中 (每3分钟更新)",
+                "API服务器: http://localhost:5000",
+                "",
+                "🔗 主要API接口:",
+                "- AI选币决策: http://localhost:5000/api/coins",
+                "- 持仓量排行: http://localhost:5000/api/oitop",
+                "- 异动数据: http://localhost:5000/api/anomalies/top",
+                "- 健康检查: http://localhost:5000/api/health",
+                "",
+                "💡 数据更新频率:",
+                "- K线数据: 实时（WebSocket）",
+                "- 异动检测: 每1分钟",
+                "- AI选币排行: 每3分钟",
+                "- 持仓量排行: 每3分钟",
+                "",
+                "按 Ctrl+C 停止系统",
+            ]))
             
-            # 主循环 - 保持程序运行并显示状态
-            last_status_time = 0
-            while self.running:
-                current_time = time.time()
-                
-                # 每30秒显示一次状态
-                if current_time - last_status_time >= 30:
-                    from database import db
-                    stats = db.get_symbol_stats()
-                    logger.info(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                                f"监控合约: {stats['symbol_count']}, "
-                                f"K线数据: {stats['kline_count']}, "
-                                f"24h异动: {stats['anomaly_count_24h']}")
-                    last_status_time = current_time
-                
-                time.sleep(1)
+            # 主循环 - 保持程序运行并每30秒检查一次状态（状态未变化时不重复输出）；
+            # 在停止事件上等待，不必每秒醒来比较时间
+            last_status = None
+            while True:
+                stats = db.get_symbol_stats()
+                status = (stats['symbol_count'], stats['kline_count'], stats['anomaly_count_24h'])
+                if status != last_status:
+                    logger.info("[%s] 监控合约: %d, K线数据: %d, 24h异动: %d",
+                                time.strftime('%H:%M:%S'), *status)
+                    last_status = status
+                if self._stop_event.wait(30):
+                    break
                 
         except Exception:
             logger.exception("启动系统时出错")
@@ -144,7 +172,7 @@ class SystemManager:
     
     def stop(self):
         """停止所有服务"""
-        self.running = False
+        self._stop_event.set()
         logger.info("正在停止系统...")
 
         if self.collector:
@@ -159,6 +187,12 @@ class SystemManager:
             except:
                 pass
 
+        # 关闭连接池中的空闲数据库连接（关闭前执行 PRAGMA optimize）
+        try:
+            db.close()
+        except Exception:
+            pass
+
         logger.info("系统已停止")
 
 if __name__ == "__main__":
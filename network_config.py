@@ -6,6 +6,8 @@ network_config.py - 网络配置和优化
 统一配置所有HTTP请求的连接池和重试策略
 """
 
+import threading
+import time
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
@@ -13,6 +15,72 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# 币安期货 REST 每分钟请求权重上限为 2400，本地按 2000 限速留出余量
+BINANCE_WEIGHT_PER_MINUTE = 2000
+
+
+class TokenBucket:
+    """线程安全的令牌桶：容量 capacity，每秒补充 refill_rate 个令牌
+
+    平时桶内令牌充足，acquire 不会等待；只有短时间内消耗接近上限时才阻塞。
+    """
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.refill_rate)
+        self._last = now
+
+    def acquire(self, tokens: float = 1):
+        """取出 tokens 个令牌，不足时等待补充"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.refill_rate
+            time.sleep(wait)
+
+    def sync_used(self, used: float):
+        """按服务端报告的已用量校正剩余令牌（只下调，不上调）"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, self.capacity - used)
+
+
+# 进程内所有币安 REST 请求共用的权重令牌桶
+binance_weight_bucket = TokenBucket(BINANCE_WEIGHT_PER_MINUTE, BINANCE_WEIGHT_PER_MINUTE / 60)
+
+
+def sync_binance_weight(response: requests.Response):
+    """用响应头 X-MBX-USED-WEIGHT-1M 校正权重令牌桶"""
+    used = response.headers.get("X-MBX-USED-WEIGHT-1M")
+    if used is not None:
+        try:
+            binance_weight_bucket.sync_used(float(used))
+        except ValueError:
+            pass
+
+
+# 不带 symbol 的全量24h行情（/fapi/v1/ticker/24hr）的请求权重
+TICKER_24HR_ALL_WEIGHT = 40
+
+
+def binance_get(session: requests.Session, url: str, weight: int = 1, **kwargs) -> requests.Response:
+    """经共享权重令牌桶发送币安 GET 请求：先扣除 weight，再按响应头校正，返回原始响应"""
+    binance_weight_bucket.acquire(weight)
+    response = session.get(url, **kwargs)
+    sync_binance_weight(response)
+    return response
+
+
 class NetworkSession:
     """统一的网络会话管理器"""
     
@@ -72,12 +140,15 @@ class NetworkSession:
 class BinanceSession:
     """币安API专用会话管理器"""
     
-    def __init__(self):
+    BASE_URL = "https://fapi.binance.com"
+    
+    def __init__(self, warm_up: bool = True):
+        # 所有请求都发往同一个主机：只需一个主机连接池，池内保留较多 keep-alive 连接
         self.session = NetworkSession.create_session(
             max_retries=3,
             backoff_factor=0.5,
-            pool_connections=5,
-            pool_maxsize=10
+            pool_connections=1,
+            pool_maxsize=20
         )
         
         # 币安API特殊配置
@@ -85,11 +156,24 @@ class BinanceSession:
             'X-MBX-APIKEY': '',  # 如果需要API KEY
         })
         
-    def get(self, url: str, **kwargs) -> requests.Response:
-        """发送GET请求"""
+        if warm_up:
+            self.warm_up()
+    
+    def warm_up(self):
+        """预先建立一条到币安的 TCP+TLS 连接放入连接池，首个业务请求不必再握手（失败不影响使用）"""
+        try:
+            self.session.head(f"{self.BASE_URL}/fapi/v1/ping", timeout=5)
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"预热币安连接失败: {e}")
+        
+    def get(self, url: str, weight: int = 1, **kwargs) -> requests.Response:
+        """发送GET请求
+
+        weight: 该接口的币安请求权重，发送前从共享令牌桶中扣除
+        """
         try:
             kwargs.setdefault('timeout', 15)
-            response = self.session.get(url, **kwargs)
+            response = binance_get(self.session, url, weight, **kwargs)
             response.raise_for_status()
             return response
         except requests.exceptions.RequestException as e:
@@ -5,30 +5,50 @@ oi_collector.py - 持仓量数据收集器
 收集币安期货的持仓量数据，用于分析市场热度
 """
 
-import requests
+import logging
 import time
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+import numpy as np
 from database import db
+from network_config import NetworkSession, TICKER_24HR_ALL_WEIGHT, binance_get
+
+logger = logging.getLogger(__name__)
+
+# 并发请求的线程数（请求速率由 network_config 的共享权重令牌桶控制）
+OI_FETCH_WORKERS = 8
+
 
 class OICollector:
     def __init__(self):
         self.base_url = "https://fapi.binance.com/fapi/v1"
-        
-    def get_symbol_oi(self, symbol: str) -> Dict:
-        """获取单个合约的持仓量数据"""
+        # 复用 keep-alive 连接，避免每个请求重新 TCP+TLS 握手；池大小与并发线程数匹配
+        self.session = NetworkSession.create_session(pool_connections=1, pool_maxsize=OI_FETCH_WORKERS)
+
+    def _get_json(self, url: str, params: Optional[Dict] = None, weight: int = 1):
+        r = binance_get(self.session, url, weight, params=params, timeout=10)
+        r.raise_for_status()
+        return r.json()
+
+    def get_ticker_map(self) -> Dict[str, Dict]:
+        """一次请求获取全部合约的24h行情，返回 {symbol: ticker}"""
+        tickers = self._get_json(f"{self.base_url}/ticker/24hr", weight=TICKER_24HR_ALL_WEIGHT)
+        return {t["symbol"]: t for t in tickers}
+
+    def get_symbol_oi(self, symbol: str, ticker_map: Optional[Dict[str, Dict]] = None) -> Optional[Dict]:
+        """获取单个合约的持仓量数据
+
+        ticker_map: 可选的全量24h行情（get_ticker_map 的结果），提供时不再单独请求该合约的行情
+        """
         try:
             # 获取当前持仓量
-            oi_url = f"{self.base_url}/openInterest"
-            r = requests.get(oi_url, params={"symbol": symbol}, timeout=10)
-            r.raise_for_status()
-            oi_data = r.json()
-            
+            oi_data = self._get_json(f"{self.base_url}/openInterest", {"symbol": symbol})
+
             # 获取24h价格变化
-            ticker_url = f"{self.base_url}/ticker/24hr"
-            r = requests.get(ticker_url, params={"symbol": symbol}, timeout=10)
-            r.raise_for_status()
-            ticker_data = r.json()
-            
+            ticker_data = ticker_map.get(symbol) if ticker_map is not None else None
+            if ticker_data is None:
+                ticker_data = self._get_json(f"{self.base_url}/ticker/24hr", {"symbol": symbol})
+
             return {
                 "symbol": symbol,
                 "current_oi": float(oi_data["openInterest"]),
@@ -36,49 +56,64 @@ class OICollector:
                 "quote_volume": float(ticker_data["quoteVolume"]),
                 "timestamp": int(time.time())
             }
-            
+
         except Exception as e:
-            print(f"获取 {symbol} 持仓量数据失败: {e}")
+            logger.warning(f"获取 {symbol} 持仓量数据失败: {e}")
             return None
-    
+
     def get_top_symbols_oi(self, symbols: List[str]) -> List[Dict]:
-        """获取多个合约的持仓量数据"""
-        oi_data = []
-        
-        for symbol in symbols:
-            data = self.get_symbol_oi(symbol)
-            if data:
-                oi_data.append(data)
-            time.sleep(0.1)  # 限速
-        
-        return oi_data
-    
+        """获取多个合约的持仓量数据（多线程并发请求，结果保持 symbols 的顺序）
+
+        24h行情先一次性全量获取，之后每个合约只需请求持仓量（N+1 次请求而不是 2N 次）；
+        全量行情获取失败时回退为逐个合约请求。
+        """
+        if not symbols:
+            return []
+        try:
+            ticker_map = self.get_ticker_map()
+        except Exception as e:
+            logger.warning(f"获取全量24h行情失败，改为逐个合约请求: {e}")
+            ticker_map = None
+        with ThreadPoolExecutor(max_workers=min(OI_FETCH_WORKERS, len(symbols))) as ex:
+            results = ex.map(lambda symbol: self.get_symbol_oi(symbol, ticker_map), symbols)
+            return [data for data in results if data]
+
     def calculate_oi_top(self, symbols: List[str], limit: int = 20) -> List[Dict]:
         """计算持仓量排行榜"""
         oi_data = self.get_top_symbols_oi(symbols)
         
         # 按持仓量排序
         oi_data.sort(key=lambda x: x["current_oi"], reverse=True)
+        top = oi_data[:limit]
+        if not top:
+            return []
         
-        # 生成排行榜
-        top_list = []
-        for rank, data in enumerate(oi_data[:limit], 1):
-            # 模拟一些数据（在实际应用中，这些需要从历史数据计算）
-            current_oi = data["current_oi"]
-            
-            top_list.append({
-                "symbol": data["symbol"],
-                "rank": rank,
-                "current_oi": current_oi,
-                "oi_delta": current_oi * 0.02,  # 模拟2%增长
-                "oi_delta_percent": 2.0 + (rank * 0.1),  # 模拟变化百分比
-                "oi_delta_value": current_oi * 0.02 * 50000,  # 模拟价值变化
-                "price_delta_percent": data["price_change_percent"],
-                "net_long": current_oi * 0.55,  # 模拟多头占55%
-                "net_short": current_oi * 0.45   # 模拟空头占45%
-            })
+        # 派生列按列整体计算（模拟数据，在实际应用中这些需要从历史数据计算）
+        current_oi = np.array([data["current_oi"] for data in top], dtype=np.float64)
+        ranks = np.arange(1, len(top) + 1)
+        oi_delta = current_oi * 0.02  # 模拟2%增长
+        columns = zip(
+            ranks.tolist(),
+            current_oi.tolist(),
+            oi_delta.tolist(),
+            (2.0 + ranks * 0.1).tolist(),  # 模拟变化百分比
+            (oi_delta * 50000).tolist(),  # 模拟价值变化
+            (current_oi * 0.55).tolist(),  # 模拟多头占55%
+            (current_oi * 0.45).tolist(),  # 模拟空头占45%
+        )
         
-        return top_list
+        # 生成排行榜
+        return [{
+            "symbol": data["symbol"],
+            "rank": rank,
+            "current_oi": oi,
+            "oi_delta": delta,
+            "oi_delta_percent": delta_percent,
+            "oi_delta_value": delta_value,
+            "price_delta_percent": data["price_change_percent"],
+            "net_long": net_long,
+            "net_short": net_short
+        } for data, (rank, oi, delta, delta_percent, delta_value, net_long, net_short) in zip(top, columns)]
 
 # 全局实例
 oi_collector = OICollector()
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""异动检测精度测试：float32 K线矩阵的计算结果与 float64 参考实现对比"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from anomaly_detector import AnomalyDetector  # noqa: E402
+
+BAR_MS = 15 * 60 * 1000
+
+
+def _make_klines(n=150, seed=7):
+    """生成接近真实行情的K线（BTC 量级价格、亿级成交额），最后两根收盘价变化很小"""
+    rng = np.random.default_rng(seed)
+    closes = 104000 + np.cumsum(rng.normal(0, 60, n))
+    closes[-2], closes[-1] = 104523.7, 104530.1
+    klines = []
+    for i, close in enumerate(closes):
+        close = round(float(close), 1)
+        spread = abs(rng.normal(0, 80))
+        klines.append({
+            "open_time": 1700000000000 + i * BAR_MS,
+            "close_time": 1700000000000 + (i + 1) * BAR_MS - 1,
+            "open_price": close,
+            "high_price": round(close + spread, 1),
+            "low_price": round(close - spread, 1),
+            "close_price": close,
+            "volume": 1000.0,
+            "quote_volume": round(float(rng.uniform(5e7, 2e8)), 2),
+            "trades_count": 100,
+        })
+    klines[-1]["quote_volume"] = 123456789.12
+    return klines
+
+
+def _reference(klines):
+    """float64 参考实现：当前收益率与三项 z-score（总体标准差）"""
+    c = np.array([k["close_price"] for k in klines])
+    h = np.array([k["high_price"] for k in klines])
+    l = np.array([k["low_price"] for k in klines])
+    v = np.array([k["quote_volume"] for k in klines])
+    returns = np.diff(c) / c[:-1]
+    abs_hist, cur_ret = np.abs(returns[:-1]), returns[-1]
+    tr = (h - l) / c * 100
+
+    def z(cur, hist):
+        return (cur - hist.mean()) / hist.std()
+
+    return {
+        "cur_return": cur_ret,
+        "close_price": c[-1],
+        "cur_volume": v[-1],
+        "cur_volatility": tr[-1],
+        "price_zscore": z(abs(cur_ret), abs_hist),
+        "volume_zscore": z(v[-1], v[:-1]),
+        "volatility_zscore": z(tr[-1], tr[:-1]),
+    }
+
+
+@pytest.fixture
+def detector_result():
+    klines = _make_klines()
+    with tempfile.TemporaryDirectory() as tmp:
+        database = Database(db_path=os.path.join(tmp, "test.db"))
+        try:
+            database.insert_klines_bulk(("BTCUSDT", k) for k in klines)
+            open_times, matrix, latest = database.get_all_recent_klines(limit_per_symbol=150)["BTCUSDT"]
+        finally:
+            database.close()
+
+    assert matrix.dtype == np.float32
+    detector = AnomalyDetector()
+    detector.config["MIN_ABS_RETURN"] = 0.0
+    results = detector.analyze_all(["BTCUSDT"], matrix[np.newaxis], open_times[-1:], {}, latest[np.newaxis])
+    assert len(results) == 1
+    return results[0], _reference(klines)
+
+
+def test_current_bar_values_match_float64(detector_result):
+    result, ref = detector_result
+    assert result.close_price == ref["close_price"]
+    assert result.cur_volume == ref["cur_volume"] == 123456789.12
+    assert result.cur_return == pytest.approx(ref["cur_return"], rel=1e-12)
+    assert result.cur_volatility == pytest.approx(ref["cur_volatility"], rel=1e-12)
+
+
+def test_zscores_within_tolerance_of_float64(detector_result):
+    result, ref = detector_result
+    for key in ("price_zscore", "volume_zscore", "volatility_zscore"):
+        assert getattr(result, key) == pytest.approx(ref[key], rel=1e-4, abs=1e-4), key
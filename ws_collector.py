@@ -5,44 +5,60 @@ ws_collector.py - WebSocket数据收集器
 通过币安WebSocket实时收集15分钟K线数据并存储到数据库
 """
 
-import json
+import os
 import time
 import threading
-import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 import websocket
 
 from database import db
-from log_config import setup_logging, LOG_FILE
-from logging.handlers import RotatingFileHandler
+import json_utils
+from log_config import setup_logging
+from network_config import TICKER_24HR_ALL_WEIGHT, get_binance_session
 
 # 初始化日志（幂等）
 setup_logging()
 
-# 为本模块创建单独的 logger -> 写文件但不向根 logger 传播（避免在控制台重复滚动）
+# 本模块使用共享的日志配置（根 logger 的滚动文件和控制台处理器），
+# 不再对同一日志文件单独挂一个 RotatingFileHandler（两个处理器各自滚动同一文件会互相冲突）。
 logger = logging.getLogger(__name__)
 # 将 ws_collector 的默认级别设置为 WARNING，避免产生大量 INFO 日志写入文件或控制台。
-# 如果需要保留这些 INFO，可以改为 logging.DEBUG 并在 handler 上单独设置级别。
+# 如果需要保留这些 INFO，可以改为 logging.DEBUG。
 logger.setLevel(logging.WARNING)
-if not getattr(logger, "_file_handler_attached", False):
-    fh = RotatingFileHandler(LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8')
-    fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
-    fh.setFormatter(fmt)
-    fh.setLevel(logging.WARNING)
-    logger.addHandler(fh)
-    # 不向上级传播到根 logger 的 handler（从而不会在控制台显示）
-    logger.propagate = False
-    logger._file_handler_attached = True
+
+# 历史K线补齐的并发请求数（每个请求权重为1，150个合约远低于币安每分钟权重上限）
+HISTORY_FETCH_WORKERS = 8
+# 断线重连的初始等待和最大等待（秒），每次失败翻倍
+RECONNECT_BASE_DELAY = 5
+RECONNECT_MAX_DELAY = 300
+# 活跃合约列表的磁盘缓存及有效期（秒）：短时间内重启/整体重连时不再重复下载 exchangeInfo 和全量24h行情
+SYMBOLS_CACHE_FILE = os.path.join(os.path.dirname(__file__), 'cache', 'active_symbols.json')
+SYMBOLS_CACHE_TTL = 300
+# 原始流端点：连接后发送 SUBSCRIBE，推送的事件不带 {"stream", "data"} 外层包装
+WS_BASE_URL = "wss://fstream.binance.com/ws"
+# 每个 WebSocket 连接订阅的合约数上限：合约分片到多个连接，单个连接断开只影响其中一部分
+SYMBOLS_PER_CONNECTION = 40
+# 未闭合K线的写库间隔（秒）：间隔内的多次盘中更新只写入最后一次；闭合K线立即写入
+OPEN_BAR_FLUSH_INTERVAL = 5
 
 
 class BinanceWSCollector:
     def __init__(self):
-        self.ws = None
+        self._sockets: List[websocket.WebSocketApp] = []
+        self._sockets_lock = threading.Lock()
         self.symbols = []
         self.running = False
+        self._stop_event = threading.Event()
         self.reconnect_count = 0
         self.max_reconnects = 10
+
+        # 写缓冲：(symbol, open_time) -> 最新的K线记录，由后台线程定期整批写入
+        self._kline_buffer: Dict[tuple, Dict] = {}
+        self._buffer_lock = threading.Lock()
+        self._flush_event = threading.Event()  # K线闭合时置位，立即刷新
+        self._flush_thread = None
         
         # 配置
         self.config = {
@@ -69,59 +85,77 @@ class BinanceWSCollector:
             return
         
         logger.info(f"需要获取历史数据的合约: {len(symbols_to_fetch)}个")
-        total = len(symbols_to_fetch)
-        for idx, symbol in enumerate(symbols_to_fetch, 1):
-            try:
-                logger.info(f"[{idx}/{total}] 获取 {symbol} 历史K线...")
-                url = "https://fapi.binance.com/fapi/v1/klines"
-                params = {"symbol": symbol, "interval": "15m", "limit": self.config["HISTORY_KLINES"]}
-                r = requests.get(url, params=params, timeout=10)
-                r.raise_for_status()
-                klines_data = r.json()
-
-                saved_count = 0
-                for kline_raw in klines_data:
-                    kline_record = {
-                        "open_time": int(kline_raw[0]),
-                        "close_time": int(kline_raw[6]),
-                        "open_price": float(kline_raw[1]),
-                        "high_price": float(kline_raw[2]),
-                        "low_price": float(kline_raw[3]),
-                        "close_price": float(kline_raw[4]),
-                        "volume": float(kline_raw[5]),
-                        "quote_volume": float(kline_raw[7]),
-                        "trades_count": int(kline_raw[8])
-                    }
-                    db.insert_kline(symbol, kline_record)
-                    saved_count += 1
-
-                logger.info(f" ✓ {saved_count}条")
-                time.sleep(0.05)
-            except Exception:
-                logger.exception(f"获取 {symbol} 历史K线失败")
-                continue
+        # 各合约的请求互不依赖，多线程并发获取，共用一个 keep-alive 连接池
+        with ThreadPoolExecutor(max_workers=min(HISTORY_FETCH_WORKERS, len(symbols_to_fetch))) as ex:
+            ex.map(self._fetch_symbol_history, symbols_to_fetch)
 
         logger.info("历史K线数据初始化完成!")
         stats = db.get_symbol_stats()
         logger.info(f"数据库统计: {stats['symbol_count']}个合约, {stats['kline_count']}条K线数据")
     
+    def _fetch_symbol_history(self, symbol: str):
+        """获取单个合约的历史K线并整批写入数据库"""
+        try:
+            url = "https://fapi.binance.com/fapi/v1/klines"
+            params = {"symbol": symbol, "interval": "15m", "limit": self.config["HISTORY_KLINES"]}
+            klines_data = json_utils.loads(get_binance_session().get(url, params=params, timeout=10).content)
+
+            # 整批历史K线一个事务写入
+            records = [(symbol, {
+                "open_time": int(kline_raw[0]),
+                "close_time": int(kline_raw[6]),
+                "open_price": float(kline_raw[1]),
+                "high_price": float(kline_raw[2]),
+                "low_price": float(kline_raw[3]),
+                "close_price": float(kline_raw[4]),
+                "volume": float(kline_raw[5]),
+                "quote_volume": float(kline_raw[7]),
+                "trades_count": int(kline_raw[8])
+            }) for kline_raw in klines_data]
+            db.insert_klines_bulk(records)
+            logger.info(f"{symbol} 历史K线 ✓ {len(records)}条")
+        except Exception:
+            logger.exception(f"获取 {symbol} 历史K线失败")
+
+    def _load_cached_symbols(self):
+        """读取未过期且筛选条件相同的合约列表缓存，没有则返回 None"""
+        try:
+            with open(SYMBOLS_CACHE_FILE, 'rb') as f:
+                cached = json_utils.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        if cached.get("config") != self.config or time.time() - cached.get("time", 0) > SYMBOLS_CACHE_TTL:
+            return None
+        return cached.get("symbols") or None
+
+    def _save_cached_symbols(self, symbols: List[str]):
+        try:
+            os.makedirs(os.path.dirname(SYMBOLS_CACHE_FILE), exist_ok=True)
+            tmp_path = SYMBOLS_CACHE_FILE + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json_utils.dumps({"time": time.time(), "config": self.config, "symbols": symbols}))
+            os.replace(tmp_path, SYMBOLS_CACHE_FILE)
+        except OSError as e:
+            logger.warning(f"写入合约列表缓存失败: {e}")
+
     def get_active_symbols(self) -> List[str]:
-        """获取活跃的USDT永续合约列表"""
+        """获取活跃的USDT永续合约列表（优先使用 SYMBOLS_CACHE_TTL 内的磁盘缓存）"""
+        cached = self._load_cached_symbols()
+        if cached is not None:
+            logger.info(f"使用缓存的活跃合约列表: {len(cached)}个")
+            return cached
+
         logger.info("获取活跃合约列表...")
         exchange_url = "https://fapi.binance.com/fapi/v1/exchangeInfo"
-        r = requests.get(exchange_url, timeout=10)
-        r.raise_for_status()
-        exchange_data = r.json()
+        exchange_data = json_utils.loads(get_binance_session().get(exchange_url, timeout=10).content)
 
-        perpetual_symbols = [
+        perpetual_symbols = {
             s["symbol"] for s in exchange_data.get("symbols", [])
             if (s.get("contractType") == "PERPETUAL" and s.get("quoteAsset") == "USDT" and s.get("status") == "TRADING")
-        ]
+        }
 
         ticker_url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
-        r = requests.get(ticker_url, timeout=10)
-        r.raise_for_status()
-        ticker_data = r.json()
+        ticker_data = json_utils.loads(get_binance_session().get(ticker_url, weight=TICKER_24HR_ALL_WEIGHT, timeout=10).content)
 
         symbol_volumes = {}
         for ticker in ticker_data:
@@ -134,17 +168,19 @@ class BinanceWSCollector:
         sorted_symbols = sorted(symbol_volumes.items(), key=lambda x: x[1], reverse=True)
         top_symbols = [symbol for symbol, _ in sorted_symbols[:self.config["TOP_N_SYMBOLS"]]]
         logger.info(f"筛选出 {len(top_symbols)} 个活跃合约（24h成交额 >= {self.config['MIN_VOL_24H']} USDT）")
+        if top_symbols:
+            self._save_cached_symbols(top_symbols)
         return top_symbols
     
-    def create_stream_url(self, symbols: List[str]) -> str:
+    def create_subscribe_message(self, symbols: List[str]) -> str:
+        """生成订阅给定合约15分钟K线的 SUBSCRIBE 请求"""
         streams = [f"{symbol.lower()}@kline_15m" for symbol in symbols]
-        base_url = "wss://fstream.binance.com/stream?streams="
-        return base_url + "/".join(streams)
+        return json_utils.dumps({"method": "SUBSCRIBE", "params": streams, "id": 1})
 
     def on_message(self, ws, message):
         try:
-            data = json.loads(message)
-            kline_data = data.get("data", {}).get("k", {})
+            data = json_utils.loads(message)
+            kline_data = data.get("k")
             if not kline_data:
                 return
 
@@ -163,59 +199,145 @@ class BinanceWSCollector:
                 "trades_count": int(kline_data["n"])
             }
 
-            db.insert_kline(symbol, kline_record)
-            current_time = time.strftime("%H:%M:%S")
-            status = "闭合" if is_closed else "更新"
-            logger.info(f"[{current_time}] {symbol} 15m K线{status}: {kline_record['close_price']:.4f}, 成交额: {kline_record['quote_volume']:.0f}")
+            with self._buffer_lock:
+                self._kline_buffer[(symbol, kline_record["open_time"])] = kline_record
+            if is_closed:
+                self._flush_event.set()
+            # 日志级别为 WARNING，逐条消息的格式化开销在热路径上能省则省
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[%s] %s 15m K线%s: %.4f, 成交额: %.0f", time.strftime("%H:%M:%S"), symbol,
+                            "闭合" if is_closed else "更新", kline_record["close_price"], kline_record["quote_volume"])
         except Exception:
             logger.exception("处理消息错误")
 
+    def flush_klines(self):
+        """把缓冲区中的K线一次性写入数据库（单个事务）"""
+        with self._buffer_lock:
+            buffer, self._kline_buffer = self._kline_buffer, {}
+        if buffer:
+            db.insert_klines_bulk((symbol, record) for (symbol, _), record in buffer.items())
+
+    def _flush_loop(self):
+        while not self._stop_event.is_set():
+            self._flush_event.wait(OPEN_BAR_FLUSH_INTERVAL)
+            self._flush_event.clear()
+            try:
+                self.flush_klines()
+            except Exception:
+                logger.exception("写入K线缓冲失败")
+
+    def _ensure_flush_thread(self):
+        if self._flush_thread is None or not self._flush_thread.is_alive():
+            self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flush_thread.start()
+
     def on_error(self, ws, error):
         logger.error(f"WebSocket错误: {error}")
 
     def on_close(self, ws, close_status_code, close_msg):
         logger.warning(f"WebSocket连接关闭: {close_status_code}, {close_msg}")
-        if self.running and self.reconnect_count < self.max_reconnects:
-            logger.info(f"准备重连... (第{self.reconnect_count + 1}次)")
-            time.sleep(5)
-            self.reconnect_count += 1
-            self.start()
 
     def on_open(self, ws):
         logger.info("WebSocket连接已建立")
         self.reconnect_count = 0
 
-    def start(self):
-        if self.running:
-            return
-        self.running = True
-        try:
-            self.symbols = self.get_active_symbols()
-            if not self.symbols:
-                logger.warning("没有找到符合条件的合约")
-                return
+    def _run_shard(self, symbols: List[str]):
+        """运行一个分片连接；断开后按指数退避单独重连，不影响其他分片
+
+        连续 max_reconnects 次未能建立连接时放弃，由 start() 重新获取合约后整体重连。
+        """
+        subscribe_message = self.create_subscribe_message(symbols)
+        failures = 0
+        while not self._stop_event.is_set():
+            opened = threading.Event()
 
-            self.fetch_initial_klines(self.symbols)
-            url = self.create_stream_url(self.symbols)
-            logger.info(f"连接到: {url[:100]}...")
+            def on_open(ws):
+                opened.set()
+                ws.send(subscribe_message)
+                self.on_open(ws)
 
-            self.ws = websocket.WebSocketApp(
-                url,
+            ws = websocket.WebSocketApp(
+                WS_BASE_URL,
                 on_message=self.on_message,
                 on_error=self.on_error,
                 on_close=self.on_close,
-                on_open=self.on_open
+                on_open=on_open
             )
+            with self._sockets_lock:
+                self._sockets.append(ws)
+            try:
+                logger.info(f"连接到: {WS_BASE_URL} ({len(symbols)}个合约)")
+                ws.run_forever()
+            finally:
+                with self._sockets_lock:
+                    self._sockets.remove(ws)
+
+            if self._stop_event.is_set():
+                break
+            failures = 0 if opened.is_set() else failures + 1
+            if failures >= self.max_reconnects:
+                logger.error(f"分片连接连续 {failures} 次失败，放弃: {symbols[0]} 等{len(symbols)}个合约")
+                break
+            delay = min(RECONNECT_BASE_DELAY * 2 ** failures, RECONNECT_MAX_DELAY)
+            logger.info(f"分片连接断开，{delay}秒后重连 ({symbols[0]} 等{len(symbols)}个合约)")
+            self._stop_event.wait(delay)
+
+    def _run_once(self):
+        """获取合约、补齐历史K线并按分片运行 WebSocket 连接，直到所有分片退出"""
+        self.symbols = self.get_active_symbols()
+        if not self.symbols:
+            logger.warning("没有找到符合条件的合约")
+            return
 
-            self.ws.run_forever()
-        except Exception:
-            logger.exception("启动WebSocket收集器失败")
+        self.fetch_initial_klines(self.symbols)
+        shard_count = -(-len(self.symbols) // SYMBOLS_PER_CONNECTION)
+        shards = [self.symbols[i::shard_count] for i in range(shard_count)]
+        threads = [threading.Thread(target=self._run_shard, args=(shard,), daemon=True) for shard in shards]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def start(self):
+        """运行收集器直到 stop() 或连续重连失败 max_reconnects 次
+
+        断线后在循环中按指数退避等待再重连（不在回调中递归调用 start）。
+        """
+        if self.running:
+            return
+        self.running = True
+        self._stop_event.clear()
+        self.reconnect_count = 0
+        self._ensure_flush_thread()
+        try:
+            while self.running:
+                try:
+                    self._run_once()
+                except Exception:
+                    logger.exception("启动WebSocket收集器失败")
+                if not self.running:
+                    break
+                if self.reconnect_count >= self.max_reconnects:
+                    logger.error(f"连续重连 {self.reconnect_count} 次失败，停止重连")
+                    break
+                delay = min(RECONNECT_BASE_DELAY * 2 ** self.reconnect_count, RECONNECT_MAX_DELAY)
+                self.reconnect_count += 1
+                logger.info(f"准备重连... (第{self.reconnect_count}次，{delay}秒后)")
+                if self._stop_event.wait(delay):
+                    break
+        finally:
             self.running = False
+            self.flush_klines()
 
     def stop(self):
         self.running = False
-        if self.ws:
-            self.ws.close()
+        self._stop_event.set()
+        self._flush_event.set()
+        with self._sockets_lock:
+            sockets = list(self._sockets)
+        for ws in sockets:
+            ws.close()
+        self.flush_klines()
         logger.info("WebSocket收集器已停止")
 
 
@@ -223,12 +345,13 @@ def start_collector_background():
     collector = BinanceWSCollector()
 
     def run_collector():
-        while True:
+        # start() 只在放弃重连或出错时返回；等待一段时间后整体重启，stop() 后退出
+        while not collector._stop_event.is_set():
             try:
                 collector.start()
             except Exception:
                 logger.exception("收集器异常")
-                time.sleep(10)
+            collector._stop_event.wait(10)
 
     thread = threading.Thread(target=run_collector, daemon=True)
     thread.start()
@@ -243,280 +366,3 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         logger.info("\n收到中断信号，正在停止...")
         collector.stop()
-#!/usr/bin/env python3
-"""
-ws_collector.py - WebSocket数据收集器
-
-通过币安WebSocket实时收集15分钟K线数据并存储到数据库
-"""
-
-import json
-import time
-import threading
-import requests
-from typing import List, Dict
-import websocket
-
-from database import db
-from log_config import setup_logging
-
-# 初始化日志（幂等）
-setup_logging()
-
-class BinanceWSCollector:
-    def __init__(self):
-        self.ws = None
-        self.symbols = []
-        self.running = False
-        self.reconnect_count = 0
-        self.max_reconnects = 10
-        
-        # 配置
-        self.config = {
-            "MIN_VOL_24H": 5000.0,  # 最小24h成交量筛选
-            "TOP_N_SYMBOLS": 150,   # 监控的合约数量
-            "HISTORY_KLINES": 16,   # 初始化时获取的历史K线数量
-        }
-    
-    def fetch_initial_klines(self, symbols: List[str]):
-        """获取所有合约的初始历史K线数据（仅当不足时才获取）"""
-        print(f"检查 {len(symbols)} 个合约的历史K线数据...")
-        
-        # 先检查哪些合约需要补充历史数据
-        symbols_to_fetch = []
-        for symbol in symbols:
-            current_count = db.get_symbol_kline_count(symbol)
-            if current_count < self.config["HISTORY_KLINES"]:
-                symbols_to_fetch.append(symbol)
-                print(f"  {symbol}: 当前{current_count}条，需要补充")
-            else:
-                print(f"  {symbol}: 已有{current_count}条，跳过")
-        
-        if not symbols_to_fetch:
-            print("所有合约都有足够的历史数据，跳过初始化步骤")
-            return
-        
-        print(f"需要获取历史数据的合约: {len(symbols_to_fetch)}个")
-        
-        total = len(symbols_to_fetch)
-        for idx, symbol in enumerate(symbols_to_fetch, 1):
-            try:
-                print(f"[{idx}/{total}] 获取 {symbol} 历史K线...", end="")
-                
-                # 获取历史K线数据
-                url = "https://fapi.binance.com/fapi/v1/klines"
-                params = {
-                    "symbol": symbol,
-                    "interval": "15m",
-                    "limit": self.config["HISTORY_KLINES"]
-                }
-                
-                r = requests.get(url, params=params, timeout=10)
-                r.raise_for_status()
-                klines_data = r.json()
-                
-                # 保存到数据库（去重由数据库UNIQUE约束处理）
-                saved_count = 0
-                for kline_raw in klines_data:
-                    kline_record = {
-                        "open_time": int(kline_raw[0]),
-                        "close_time": int(kline_raw[6]),
-                        "open_price": float(kline_raw[1]),
-                        "high_price": float(kline_raw[2]),
-                        "low_price": float(kline_raw[3]),
-                        "close_price": float(kline_raw[4]),
-                        "volume": float(kline_raw[5]),
-                        "quote_volume": float(kline_raw[7]),
-                        "trades_count": int(kline_raw[8])
-                    }
-                    
-                    # INSERT OR REPLACE 自动处理重复数据
-                    db.insert_kline(symbol, kline_record)
-                    saved_count += 1
-                
-                print(f" ✓ {saved_count}条")
-                
-                # 简单限速避免请求过快
-                time.sleep(0.05)
-                
-            except Exception as e:
-                print(f" ✗ 失败: {e}")
-                continue
-        
-        print("历史K线数据初始化完成!")
-        
-        # 显示统计信息
-        stats = db.get_symbol_stats()
-        print(f"数据库统计: {stats['symbol_count']}个合约, {stats['kline_count']}条K线数据")
-    
-    def get_active_symbols(self) -> List[str]:
-        """获取活跃的USDT永续合约列表"""
-        print("获取活跃合约列表...")
-        
-        # 获取合约信息
-        exchange_url = "https://fapi.binance.com/fapi/v1/exchangeInfo"
-        r = requests.get(exchange_url, timeout=10)
-        r.raise_for_status()
-        exchange_data = r.json()
-        
-        perpetual_symbols = [
-            s["symbol"] for s in exchange_data.get("symbols", [])
-            if (s.get("contractType") == "PERPETUAL" and 
-                s.get("quoteAsset") == "USDT" and 
-                s.get("status") == "TRADING")
-        ]
-        
-        # 获取24h成交额数据
-        ticker_url = "https://fapi.binance.com/fapi/v1/ticker/24hr"
-        r = requests.get(ticker_url, timeout=10)
-        r.raise_for_status()
-        ticker_data = r.json()
-        
-        # 过滤并排序
-        symbol_volumes = {}
-        for ticker in ticker_data:
-            symbol = ticker["symbol"]
-            if symbol in perpetual_symbols:
-                quote_volume = float(ticker.get("quoteVolume", 0) or 0)
-                if quote_volume >= self.config["MIN_VOL_24H"]:
-                    symbol_volumes[symbol] = quote_volume
-        
-        # 按成交额排序，取前N个
-        sorted_symbols = sorted(symbol_volumes.items(), key=lambda x: x[1], reverse=True)
-        top_symbols = [symbol for symbol, _ in sorted_symbols[:self.config["TOP_N_SYMBOLS"]]]
-        
-        print(f"筛选出 {len(top_symbols)} 个活跃合约（24h成交额 >= {self.config['MIN_VOL_24H']} USDT）")
-        return top_symbols
-    
-    def create_stream_url(self, symbols: List[str]) -> str:
-        """创建WebSocket流URL"""
-        # 构建15分钟K线流
-        streams = [f"{symbol.lower()}@kline_15m" for symbol in symbols]
-        base_url = "wss://fstream.binance.com/stream?streams="
-        return base_url + "/".join(streams)
-    
-    def on_message(self, ws, message):
-        """处理WebSocket消息"""
-        try:
-            data = json.loads(message)
-            stream = data.get("stream", "")
-            kline_data = data.get("data", {}).get("k", {})
-            
-            if not kline_data:
-                return
-            
-            symbol = kline_data["s"]
-            is_closed = kline_data.get("x", False)  # x表示该K线是否闭合
-            
-            # 构建K线数据
-            kline_record = {
-                "open_time": int(kline_data["t"]),
-                "close_time": int(kline_data["T"]),
-                "open_price": float(kline_data["o"]),
-                "high_price": float(kline_data["h"]),
-                "low_price": float(kline_data["l"]),
-                "close_price": float(kline_data["c"]),
-                "volume": float(kline_data["v"]),
-                "quote_volume": float(kline_data["q"]),
-                "trades_count": int(kline_data["n"])
-            }
-            
-            # 存储到数据库（INSERT OR REPLACE自动处理重复数据）
-            # 数据库UNIQUE(symbol, open_time)约束确保去重
-            db.insert_kline(symbol, kline_record)
-            
-            current_time = time.strftime("%H:%M:%S")
-            status = "闭合" if is_closed else "更新"
-            logger.info(f"[{current_time}] {symbol} 15m K线{status}: {kline_record['close_price']:.4f}, 成交额: {kline_record['quote_volume']:.0f}")
-            
-        except Exception as e:
-            print(f"处理消息错误: {e}")
-    
-    def on_error(self, ws, error):
-        """处理WebSocket错误"""
-        print(f"WebSocket错误: {error}")
-    
-    def on_close(self, ws, close_status_code, close_msg):
-        """WebSocket连接关闭"""
-        print(f"WebSocket连接关闭: {close_status_code}, {close_msg}")
-        if self.running and self.reconnect_count < self.max_reconnects:
-            print(f"准备重连... (第{self.reconnect_count + 1}次)")
-            time.sleep(5)
-            self.reconnect_count += 1
-            self.start()
-    
-    def on_open(self, ws):
-        """WebSocket连接打开"""
-        print("WebSocket连接已建立")
-        self.reconnect_count = 0
-    
-    def start(self):
-        """启动WebSocket收集器"""
-        if self.running:
-            return
-            
-        self.running = True
-        
-        try:
-            # 获取要监控的合约
-            self.symbols = self.get_active_symbols()
-            
-            if not self.symbols:
-                print("没有找到符合条件的合约")
-                return
-            
-            # 首先获取历史K线数据填充数据库
-            self.fetch_initial_klines(self.symbols)
-            
-            # 创建WebSocket连接
-            url = self.create_stream_url(self.symbols)
-            print(f"连接到: {url[:100]}...")
-            
-            self.ws = websocket.WebSocketApp(
-                url,
-                on_message=self.on_message,
-                on_error=self.on_error,
-                on_close=self.on_close,
-                on_open=self.on_open
-            )
-            
-            # 启动WebSocket（这会阻塞当前线程）
-            self.ws.run_forever()
-            
-        except Exception as e:
-            print(f"启动WebSocket收集器失败: {e}")
-            self.running = False
-    
-    def stop(self):
-        """停止WebSocket收集器"""
-        self.running = False
-        if self.ws:
-            self.ws.close()
-        print("WebSocket收集器已停止")
-
-def start_collector_background():
-    """在后台线程启动收集器"""
-    collector = BinanceWSCollector()
-    
-    def run_collector():
-        while True:
-            try:
-                collector.start()
-            except Exception as e:
-                print(f"收集器异常: {e}")
-                time.sleep(10)  # 等待10秒后重试
-    
-    thread = threading.Thread(target=run_collector, daemon=True)
-    thread.start()
-    return collector
-
-if __name__ == "__main__":
-    print("=== 币安WebSocket数据收集器 ===")
-    
-    collector = BinanceWSCollector()
-    
-    try:
-        collector.start()
-    except KeyboardInterrupt:
-        print("\n收到中断信号，正在停止...")
-        collector.stop()
\ No newline at end of file
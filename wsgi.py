@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+wsgi.py - WSGI入口
+
+供生产环境的 WSGI 服务器加载 API 应用，例如：
+
+    gunicorn -k gevent -w 4 -b 0.0.0.0:5000 wsgi:application
+
+此时只运行API服务，数据收集与异动检测仍由 main.py 负责
+（需在 config.py 中把 API_CONFIG["embedded"] 设为 False，避免端口冲突）。
+"""
+
+from api_server import app
+
+application = app